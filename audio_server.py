@@ -0,0 +1,281 @@
+"""WebSocket audio ingestion: browsers stream microphone audio to the server
+
+Each connection is one session with its own streaming recognizer, so many
+candidates can practice at once and the server needs no sound device.
+Every session also exposes its decoded audio as a SessionAudioSource, which
+an InterviewEngine accepts in place of an AudioRecorder; pass on_session to
+serve() to run one per connection, which then does the recognition instead
+of the session.
+
+Protocol:
+    1. The client sends a JSON config: {"codec": "pcm16" | "opus", "samplerate": 16000, "channels": 1}
+    2. The server answers {"type": "ready"} (or {"type": "error", "message": ...} and closes)
+    3. The client sends binary frames: little-endian 16-bit PCM, or one Opus packet per frame
+    4. The server sends {"type": "partial" | "final", "text": ...} as recognition progresses
+    5. The client sends {"type": "end"}, the server flushes {"type": "end", "text": ...} and closes
+
+Usage:
+    python audio_server.py serve [--host 0.0.0.0] [--port 8765]
+    python audio_server.py replay mock_audio.wav [--sessions 20] [--codec opus] [--fast]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import time
+import numpy as np
+import soundfile as sf
+import websockets
+from concurrent.futures import ThreadPoolExecutor
+from speech_utils import AudioRecorder, get_recognizer_pool
+
+try:
+    import opuslib
+except ImportError:
+    opuslib = None
+
+DEFAULT_PORT = 8765
+CODECS = ("pcm16", "opus")
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+OPUS_FRAME_MS = 20
+MAX_OPUS_FRAME_MS = 120   # longest packet an Opus decoder can return
+MAX_MESSAGE_BYTES = 1 << 20
+REPLAY_CHUNK_MS = 100
+
+class SessionAudioSource(AudioRecorder):
+    """Audio of one connection with the AudioRecorder surface the engine uses
+
+    Blocks are pushed by the session instead of captured from a sound device,
+    and reach listeners as float32 (frames, 1) arrays like sounddevice's.
+    """
+    def __init__(self, samplerate=16000, model=None):
+        super().__init__(samplerate=samplerate, channels=1, model=model, buffered=False)
+    
+    def push(self, pcm):
+        """Hand a block of 16-bit mono PCM to the listeners"""
+        block = (pcm.astype(np.float32) / 32768.0).reshape(-1, 1)
+        self.callback(block, len(block), None, None)
+    
+    def start(self):
+        pass
+    
+    def stop(self):
+        pass
+
+class AudioSession:
+    """Decoder and recognizer state of one connection, used from worker threads"""
+    def __init__(self, config):
+        self.codec = config.get("codec", "pcm16")
+        self.samplerate = int(config.get("samplerate", 16000))
+        self.channels = int(config.get("channels", 1))
+        if self.codec not in CODECS:
+            raise ValueError(f"codec must be one of {CODECS}")
+        if self.channels not in (1, 2):
+            raise ValueError("channels must be 1 or 2")
+        self.decoder = None
+        if self.codec == "opus":
+            if opuslib is None:
+                raise ValueError("Opus is not supported, install opuslib or send pcm16")
+            if self.samplerate not in OPUS_RATES:
+                raise ValueError(f"Opus samplerate must be one of {OPUS_RATES}")
+            self.decoder = opuslib.Decoder(self.samplerate, self.channels)
+        self.source = SessionAudioSource(self.samplerate)
+        self.pool = get_recognizer_pool(self.source.model, self.samplerate)
+        # Checked out last, nothing after it can fail and leave it out of the pool
+        self.recognizer = self.pool.checkout()
+        self.partial = ""
+        self.frames = 0
+        self.samples = 0
+
+    def _decode(self, frame):
+        if self.decoder:
+            frame = self.decoder.decode(frame, self.samplerate * MAX_OPUS_FRAME_MS // 1000)
+        pcm = np.frombuffer(frame, dtype="<i2")
+        if self.channels > 1:
+            pcm = pcm[:len(pcm) // self.channels * self.channels].reshape(-1, self.channels)
+            pcm = pcm.mean(axis=1).astype(np.int16)
+        return pcm
+
+    def feed(self, frame):
+        """Decode and recognize one frame, return the message to send back or None"""
+        pcm = self._decode(frame)
+        self.frames += 1
+        self.samples += len(pcm)
+        self.source.push(pcm)
+        if self.recognizer is None:
+            return None
+        if self.recognizer.AcceptWaveform(pcm.tobytes()):
+            self.partial = ""
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            return {"type": "final", "text": text} if text else None
+        partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        if partial != self.partial:
+            self.partial = partial
+            return {"type": "partial", "text": partial}
+        return None
+
+    def detach(self):
+        """Leave recognition to an engine listening to source, so audio is decoded once"""
+        if self.recognizer is not None:
+            self.pool.checkin(self.recognizer)
+            self.recognizer = None
+
+    def close(self):
+        """Flush the recognizer and return it to the pool"""
+        if self.recognizer is None:
+            return ""
+        text = json.loads(self.recognizer.FinalResult()).get("text", "")
+        self.pool.checkin(self.recognizer)
+        self.recognizer = None
+        return text
+
+async def handle(websocket, executor, stats, on_session=None):
+    """Serve one browser session
+
+    on_session(session) runs once the session is ready and may return a
+    started InterviewEngine listening to session.source. The session then
+    stops recognizing itself and the engine is stopped when it ends.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        config = json.loads(await websocket.recv())
+        session = await loop.run_in_executor(executor, AudioSession, config)
+    except (ValueError, TypeError, AttributeError) as e:
+        await websocket.send(json.dumps({"type": "error", "message": str(e)}))
+        return
+    stats["active"] += 1
+    stats["sessions"] += 1
+    engine = None
+    try:
+        if on_session:
+            engine = await loop.run_in_executor(executor, on_session, session)
+            if engine:
+                session.detach()
+        await websocket.send(json.dumps({"type": "ready"}))
+        async for message in websocket:
+            if isinstance(message, str):
+                if json.loads(message).get("type") == "end":
+                    break
+                continue
+            # One frame at a time per session keeps the recognizer input in order
+            result = await loop.run_in_executor(executor, session.feed, message)
+            if result:
+                await websocket.send(json.dumps(result))
+        text = await loop.run_in_executor(executor, session.close)
+        await websocket.send(json.dumps({"type": "end", "text": text}))
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        stats["active"] -= 1
+        stats["audio_seconds"] += session.samples / session.samplerate
+        if engine:
+            await loop.run_in_executor(executor, engine.stop)
+        await loop.run_in_executor(executor, session.close)
+
+async def serve(host, port, workers, on_session=None):
+    executor = ThreadPoolExecutor(max_workers=workers)
+    stats = {"sessions": 0, "active": 0, "audio_seconds": 0.0}
+    handler = functools.partial(handle, executor=executor, stats=stats, on_session=on_session)
+    async with websockets.serve(handler, host, port, max_size=MAX_MESSAGE_BYTES):
+        print(f"Listening on ws://{host}:{port} with {workers} workers")
+        while True:
+            await asyncio.sleep(10)
+            if stats["active"]:
+                print(f"{stats['active']} active sessions, {stats['sessions']} total, "
+                      f"{stats['audio_seconds']:.0f} s of audio recognized")
+
+# Load-test client
+def encode_frames(path, codec):
+    """Split a WAV file into the frames a browser client would send"""
+    audio, samplerate = sf.read(path, dtype="int16", always_2d=True)
+    audio = audio.mean(axis=1).astype(np.int16) if audio.shape[1] > 1 else audio[:, 0]
+    if codec == "opus":
+        if opuslib is None:
+            raise RuntimeError("Opus replay needs opuslib")
+        if samplerate not in OPUS_RATES:
+            raise RuntimeError(f"Opus needs one of {OPUS_RATES} Hz, {path} is {samplerate} Hz")
+        encoder = opuslib.Encoder(samplerate, 1, opuslib.APPLICATION_VOIP)
+        size = samplerate * OPUS_FRAME_MS // 1000
+        audio = np.pad(audio, (0, -len(audio) % size))
+        frames = [encoder.encode(audio[i:i + size].tobytes(), size) for i in range(0, len(audio), size)]
+        return frames, samplerate, OPUS_FRAME_MS / 1000
+    size = samplerate * REPLAY_CHUNK_MS // 1000
+    frames = [audio[i:i + size].tobytes() for i in range(0, len(audio), size)]
+    return frames, samplerate, REPLAY_CHUNK_MS / 1000
+
+async def replay(url, frames, samplerate, codec, interval):
+    """Stream frames like a live microphone and return the transcript and final latency"""
+    async with websockets.connect(url, max_size=MAX_MESSAGE_BYTES) as websocket:
+        await websocket.send(json.dumps({"codec": codec, "samplerate": samplerate, "channels": 1}))
+        reply = json.loads(await websocket.recv())
+        if reply["type"] != "ready":
+            raise RuntimeError(reply.get("message", reply))
+
+        async def receive():
+            texts = []
+            while True:
+                message = json.loads(await websocket.recv())
+                if message["type"] == "final":
+                    texts.append(message["text"])
+                elif message["type"] == "end":
+                    texts.append(message["text"])
+                    return " ".join(t for t in texts if t), time.perf_counter()
+
+        receiver = asyncio.create_task(receive())
+        start = time.perf_counter()
+        for index, frame in enumerate(frames):
+            await websocket.send(frame)
+            if interval:
+                # Pace against the start time so send jitter does not accumulate
+                await asyncio.sleep(max(0.0, start + (index + 1) * interval - time.perf_counter()))
+        sent = time.perf_counter()
+        await websocket.send(json.dumps({"type": "end"}))
+        text, finished = await receiver
+        return text, finished - sent
+
+async def load_test(url, path, sessions, codec, realtime):
+    frames, samplerate, interval = encode_frames(path, codec)
+    duration = len(frames) * interval
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(replay(url, frames, samplerate, codec, interval if realtime else 0) for _ in range(sessions)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    failed = [r for r in results if isinstance(r, Exception)]
+    done = [r for r in results if not isinstance(r, Exception)]
+    print(f"{sessions} sessions of {duration:.1f} s {codec} audio in {elapsed:.1f} s, {len(failed)} failed")
+    if failed:
+        print(f"First error: {failed[0]!r}")
+    if done:
+        lags = sorted(lag for _, lag in done)
+        print(f"Final transcript after end of audio: median {lags[len(lags) // 2] * 1000:.0f} ms, "
+              f"max {lags[-1] * 1000:.0f} ms")
+        transcripts = {text for text, _ in done}
+        print(f"{len(transcripts)} distinct transcript(s): {done[0][0]!r}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    server = sub.add_parser("serve", help="run the ingestion server")
+    server.add_argument("--host", default="0.0.0.0")
+    server.add_argument("--port", type=int, default=DEFAULT_PORT)
+    server.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+
+    client = sub.add_parser("replay", help="replay a WAV file over many concurrent sessions")
+    client.add_argument("path", nargs="?", default="mock_audio.wav")
+    client.add_argument("--url", default=f"ws://localhost:{DEFAULT_PORT}")
+    client.add_argument("--sessions", type=int, default=1)
+    client.add_argument("--codec", choices=CODECS, default="pcm16")
+    client.add_argument("--fast", action="store_true", help="send as fast as possible instead of in real time")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        asyncio.run(serve(args.host, args.port, args.workers))
+    else:
+        asyncio.run(load_test(args.url, args.path, args.sessions, args.codec, not args.fast))
+
+if __name__ == "__main__":
+    main()
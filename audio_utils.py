@@ -1,12 +1,212 @@
 from gtts import gTTS
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import threading
+import hashlib
+import subprocess
+import shutil
+import struct
+import wave
+import io
+import re
 import os
 
-def play_audio(text, output_file="response.wav"):
-    """Convert text to speech and save to file"""
+load_dotenv()
+
+# Sentence boundary: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+")
+# Avoid synthesizing tiny fragments such as "e.g." or "1." on their own
+MIN_SENTENCE_CHARS = 20
+# gTTS serves 32 kbps constant-bitrate MP3
+GTTS_BITRATE = 32000
+DEFAULT_TTS_BACKEND = "gtts"
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+
+# Text-to-speech backends
+class TTSBackend:
+    """Base class for text-to-speech engines"""
+    name = None
+    mime = None
+
+    def __init__(self, lang='en', voice=None):
+        self.lang = lang
+        self.voice = voice
+
+    def synthesize(self, text):
+        """Return the encoded audio for text"""
+        raise NotImplementedError
+
+    def duration(self, audio_bytes):
+        """Return the playback length of synthesized audio in seconds"""
+        raise NotImplementedError
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS over the network, voice is the accent domain (tld)"""
+    name = "gtts"
+    mime = "audio/mp3"
+
+    def __init__(self, lang='en', voice="com"):
+        super().__init__(lang, voice)
+
+    def synthesize(self, text):
+        fp = io.BytesIO()
+        gTTS(text=text, lang=self.lang, tld=self.voice, slow=False).write_to_fp(fp)
+        return fp.getvalue()
+
+    def duration(self, audio_bytes):
+        return len(audio_bytes) * 8 / GTTS_BITRATE
+
+class EspeakBackend(TTSBackend):
+    """Offline formant synthesizer (espeak-ng), runs locally on the CPU"""
+    name = "espeak"
+    mime = "audio/wav"
+
+    def __init__(self, lang='en', voice=None, rate=170):
+        super().__init__(lang, voice or os.getenv("ESPEAK_VOICE", "en-us"))
+        self.rate = rate
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.executable:
+            raise RuntimeError("espeak-ng is not installed")
+
+    def synthesize(self, text):
+        # Text goes through stdin so it can never be parsed as an option
+        result = subprocess.run(
+            [self.executable, "-v", self.voice, "-s", str(self.rate), "--stdout"],
+            input=text.encode("utf-8"),
+            capture_output=True,
+            check=True
+        )
+        return fix_wav_header(result.stdout)
+
+    def duration(self, audio_bytes):
+        with wave.open(io.BytesIO(audio_bytes)) as wav:
+            return wav.getnframes() / wav.getframerate()
+
+def fix_wav_header(data):
+    """Fill in the RIFF/data sizes that streaming WAV writers leave unset"""
+    pos = data.find(b"data", 12)
+    if not data.startswith(b"RIFF") or pos < 0:
+        return data
+    data = bytearray(data)
+    struct.pack_into("<I", data, 4, len(data) - 8)
+    struct.pack_into("<I", data, pos + 4, len(data) - pos - 8)
+    return bytes(data)
+
+TTS_BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    EspeakBackend.name: EspeakBackend,
+}
+_backends = {}
+
+def get_tts_backend(name=None):
+    """Return the configured TTS backend (TTS_BACKEND env var, gTTS by default)"""
+    name = (name or os.getenv("TTS_BACKEND") or DEFAULT_TTS_BACKEND).lower()
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"Unknown TTS backend '{name}', choose from {sorted(TTS_BACKENDS)}")
+    if name not in _backends:
+        _backends[name] = TTS_BACKENDS[name]()
+    return _backends[name]
+
+# Synthesized speech cache
+class AudioCache:
+    """Content-addressed LRU cache of synthesized speech, bounded by total bytes"""
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(text, backend):
+        """Hash of everything that changes the synthesized audio"""
+        parts = [backend.name, backend.lang, str(backend.voice), text]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            audio = self.entries.get(key)
+            if audio is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return audio
+
+    def put(self, key, audio):
+        if len(audio) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = audio
+            self.size += len(audio)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def synthesize(self, text, backend=None):
+        """Return cached audio for text, synthesizing it on a miss"""
+        backend = backend or get_tts_backend()
+        key = self.key(text, backend)
+        audio = self.get(key)
+        if audio is None:
+            audio = backend.synthesize(text)
+            self.put(key, audio)
+        return audio
+
+    def precompute(self, texts, backend=None, max_workers=4):
+        """Synthesize fixed phrases ahead of time so they play without a round trip"""
+        backend = backend or get_tts_backend()
+        texts = [t for t in dict.fromkeys(texts) if self.get(self.key(t, backend)) is None]
+
+        def warm(text):
+            try:
+                self.synthesize(text, backend)
+            except Exception as e:
+                print(f"Error precomputing speech for '{text[:40]}': {e}")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(warm, texts))
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+speech_cache = AudioCache(int(os.getenv("TTS_CACHE_BYTES", DEFAULT_CACHE_BYTES)))
+
+def play_audio(text, backend=None):
+    """Convert text to speech and return the audio bytes (backend.mime format)"""
     try:
-        tts = gTTS(text=text, lang='en', slow=False)
-        tts.save(output_file)
-        return True
+        return speech_cache.synthesize(text, backend)
     except Exception as e:
         print(f"Error in text-to-speech: {e}")
-        return False
\ No newline at end of file
+        return None
+
+class SentenceSplitter:
+    """Incrementally cut a token stream at sentence boundaries"""
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, token):
+        """Add a token and return the sentences it completed"""
+        self.buffer += token
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            if match.end() - start < self.min_chars:
+                continue
+            sentence = self.buffer[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Return whatever is left once the stream has ended"""
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
@@ -0,0 +1,116 @@
+"""Performance benchmarks for the speech pipeline
+
+Usage:
+    python benchmark.py tts [--backends gtts espeak] [--repeat 3]
+    python benchmark.py asr [sample.wav mock_audio.wav] [--snr 10] [--reference sample.wav="expected words"]
+"""
+import argparse
+import time
+import numpy as np
+import soundfile as sf
+from audio_utils import TTS_BACKENDS, get_tts_backend
+
+TTS_SENTENCES = [
+    "Hello! I'll be your mock interview coach today.",
+    "Tell me about a time you faced a conflict at work and how you resolved it.",
+    "That is a solid answer, but try to quantify the impact of your work with concrete numbers.",
+]
+ASR_FILES = ["sample.wav", "mock_audio.wav"]
+
+def bench_tts(backend_names, repeat=3):
+    """Report the real-time factor (synthesis time / audio length) of each TTS backend"""
+    print(f"{'backend':<10}{'synth s':>10}{'audio s':>10}{'RTF':>8}{'first s':>10}")
+    for name in backend_names:
+        try:
+            backend = get_tts_backend(name)
+        except Exception as e:
+            print(f"{name:<10}unavailable: {e}")
+            continue
+        synth_time = audio_time = 0.0
+        first_chunk = []
+        try:
+            for _ in range(repeat):
+                for sentence in TTS_SENTENCES:
+                    start = time.perf_counter()
+                    audio = backend.synthesize(sentence)
+                    elapsed = time.perf_counter() - start
+                    synth_time += elapsed
+                    audio_time += backend.duration(audio)
+                    if sentence is TTS_SENTENCES[0]:
+                        first_chunk.append(elapsed)
+        except Exception as e:
+            print(f"{name:<10}failed: {e}")
+            continue
+        first = sorted(first_chunk)[len(first_chunk) // 2]
+        print(f"{name:<10}{synth_time:>10.2f}{audio_time:>10.2f}{synth_time / audio_time:>8.3f}{first:>10.3f}")
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance divided by the reference length"""
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    if not ref:
+        return float(bool(hyp))
+    row = list(range(len(hyp) + 1))
+    for i, word in enumerate(ref, 1):
+        previous, row[0] = row[0], i
+        for j, other in enumerate(hyp, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (word != other))
+    return row[-1] / len(ref)
+
+def bench_asr(paths, references, snr=None):
+    """Report the cost of audio preprocessing and recognition with and without it"""
+    # Imported here so the TTS benchmark runs without Vosk or an audio device
+    from speech_utils import AudioPreprocessor, transcribe_audio, BLOCK_DURATION
+    rng = np.random.default_rng(0)
+    for path in paths:
+        audio, samplerate = sf.read(path, dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+        duration = len(audio) / samplerate
+        if snr is not None:
+            noise_rms = np.sqrt(np.mean(np.square(audio))) / 10 ** (snr / 20)
+            audio = np.clip(audio + rng.normal(0, noise_rms, len(audio)).astype(np.float32), -1.0, 1.0)
+
+        # Feed microphone-sized blocks, as the interview engine does
+        preprocessor = AudioPreprocessor(samplerate)
+        block = int(samplerate * BLOCK_DURATION)
+        start = time.perf_counter()
+        cleaned = np.concatenate([preprocessor.process(audio[i:i + block]) for i in range(0, len(audio), block)])
+        elapsed = time.perf_counter() - start
+
+        raw_text = transcribe_audio(audio, samplerate) or ""
+        clean_text = transcribe_audio(cleaned, samplerate) or ""
+        print(f"{path}: {duration:.1f} s" + (f", white noise at {snr} dB SNR" if snr is not None else ""))
+        print(f"  preprocessing {elapsed * 1000:.1f} ms, RTF {elapsed / duration:.4f} "
+              f"({elapsed / duration * 100:.2f}% of one core)")
+        print(f"  raw:          {raw_text!r}")
+        print(f"  preprocessed: {clean_text!r}")
+        reference = references.get(path)
+        if reference:
+            print(f"  WER raw {word_error_rate(reference, raw_text):.1%}, "
+                  f"preprocessed {word_error_rate(reference, clean_text):.1%}")
+        else:
+            print(f"  preprocessed vs raw word difference {word_error_rate(raw_text, clean_text):.1%} "
+                  f"(pass --reference for accuracy)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    tts = sub.add_parser("tts", help="compare text-to-speech backends")
+    tts.add_argument("--backends", nargs="+", default=sorted(TTS_BACKENDS))
+    tts.add_argument("--repeat", type=int, default=3)
+
+    asr = sub.add_parser("asr", help="measure audio preprocessing cost and recognition accuracy")
+    asr.add_argument("paths", nargs="*", default=ASR_FILES)
+    asr.add_argument("--snr", type=float, help="add white noise at this signal-to-noise ratio in dB")
+    asr.add_argument("--reference", action="append", default=[], metavar="FILE=TEXT",
+                     help="expected transcript of a file, for the word error rate")
+
+    args = parser.parse_args()
+    if args.command == "tts":
+        bench_tts(args.backends, args.repeat)
+    elif args.command == "asr":
+        references = dict(r.split("=", 1) for r in args.reference)
+        bench_asr(args.paths, references, args.snr)
+
+if __name__ == "__main__":
+    main()
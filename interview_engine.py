@@ -0,0 +1,562 @@
+import numpy as np
+import threading
+import queue
+import json
+import time
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from speech_utils import get_recognizer_pool, Rescorer, CommandSpotter, AudioPreprocessor, BLOCK_DURATION, SPEECH_THRESHOLD
+from openai_utils import generate_gpt_response_with_history
+from audio_utils import SentenceSplitter, play_audio, get_tts_backend
+
+CONTEXT_MESSAGES = 10  # earlier turns sent along with each new answer
+AUDIO_QUEUE_SIZE = 50     # mic blocks (5 s) waiting for recognition before the oldest are dropped
+TRANSCRIPT_QUEUE_SIZE = 2  # finished answers waiting for the LLM stage
+SPEECH_QUEUE_SIZE = 4      # sentences being synthesized or waiting for delivery
+TTS_WORKERS = 3
+MAX_UTTERANCE_SECONDS = 30  # audio kept per utterance for the rescoring pass
+NEXT_QUESTION_PROMPT = "Please move on to the next question."
+ECHO_MODES = ("gate", "attenuate", "off")
+ECHO_TAIL = 0.3          # seconds of room echo after playback ends
+ECHO_ATTENUATION = 0.1   # gain applied to mic input during playback in attenuate mode
+ECHO_OVERLAP = 0.6       # share of a transcript's words found in recent speech that marks it as echo
+BARGE_IN_BLOCKS = 3      # consecutive loud blocks that interrupt playback
+
+def _ms(seconds):
+    return round(seconds * 1000)
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+class Speculation:
+    """A reply generated ahead of time from a partial transcript that stopped changing"""
+    def __init__(self, transcript, messages, images, context_size, image_version=0):
+        self.transcript = transcript
+        self.image_version = image_version
+        self.context_size = context_size
+        self.tokens = []
+        self.done = False
+        self.cancelled = threading.Event()
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, args=(messages, images), daemon=True)
+        self.thread.start()
+
+    def _run(self, messages, images):
+        stream = generate_gpt_response_with_history(messages, images=images)
+        try:
+            for token in stream:
+                if self.cancelled.is_set():
+                    break
+                with self.cond:
+                    self.tokens.append(token)
+                    self.cond.notify_all()
+        finally:
+            stream.close()
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def stream(self):
+        """Yield the tokens buffered so far, then follow the live completion"""
+        index = 0
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: index < len(self.tokens) or self.done)
+                if index >= len(self.tokens):
+                    return
+                token = self.tokens[index]
+            index += 1
+            yield token
+
+class TurnTrace:
+    """Timestamps of one turn as it moves through the pipeline stages.
+
+    speech_end is when the user stopped speaking, so asr_ms includes the
+    recognizer's endpointing silence.
+    """
+    def __init__(self, turn, transcript, speech_end):
+        self.turn = turn
+        self.transcript = transcript
+        self.marks = {"speech_end": speech_end, "transcribed": time.monotonic()}
+        self.speculation = None
+
+    def mark(self, stage):
+        """Record when a stage was first reached"""
+        self.marks.setdefault(stage, time.monotonic())
+
+    def _span(self, start, end):
+        if start in self.marks and end in self.marks:
+            return _ms(self.marks[end] - self.marks[start])
+        return None
+
+    def breakdown(self):
+        """Per-stage latency in milliseconds"""
+        return {
+            "turn": self.turn,
+            "asr_ms": self._span("speech_end", "transcribed"),
+            "queue_ms": self._span("transcribed", "llm_start"),
+            "first_token_ms": self._span("llm_start", "first_token"),
+            "first_sentence_ms": self._span("first_token", "first_sentence"),
+            "tts_ms": self._span("first_sentence", "first_audio"),
+            "llm_total_ms": self._span("llm_start", "llm_done"),
+            "first_audio_ms": self._span("speech_end", "first_audio"),
+            "turn_ms": self._span("speech_end", "delivered"),
+            "speculative": self.speculation is not None,
+        }
+
+# Event-driven interview session
+class InterviewEngine:
+    """Run an interview as a pipeline of recognition, reply and speech stages.
+
+    Audio blocks from the recorder (an AudioRecorder, or the SessionAudioSource
+    of an audio_server connection) feed a streaming recognizer. A final
+    transcript goes straight to the LLM stage, whose sentences are synthesized
+    while the reply is still generating and delivered in order. Stages are
+    joined by bounded queues, so the recognizer keeps listening during a reply.
+    The engine never touches st.session_state: it posts event dicts to
+    `outbox`, which the Streamlit script drains with poll().
+
+    image_source(since_version), if given, returns (version, content part) for
+    a screen keyframe newer than since_version, or None. A keyframe is
+    attached to the first turn after it appears and not sent again.
+
+    With speculation_window set, a completion is started as soon as the
+    partial transcript has been stable for that many seconds. It is committed
+    if the final transcript matches and cancelled otherwise.
+
+    With rescore_model set, each utterance is transcribed again by that
+    larger model in the background. The better transcript replaces the one in
+    the conversation history and is posted as a transcript_rescored event.
+
+    With spot_commands, "next question", "repeat" and "end session" are
+    picked up by a grammar recognizer on the same audio and handled without
+    sending the phrase to the LLM. Each posts a command event; "end" is left
+    to the caller, which owns the session.
+
+    Playback happens in the browser, so the engine estimates when its audio
+    is playing from the chunk durations (the caller can confirm with
+    playing_until). During playback the recognizer input is gated to silence
+    or attenuated, unless the speaker is louder than barge_in_threshold for a
+    few blocks, which stops the reply and posts a barge_in event. Transcripts
+    that repeat what was just spoken are dropped and counted as spurious turns.
+
+    With preprocess, mic audio is high-pass filtered, denoised and gain
+    normalized by an AudioPreprocessor before recognition.
+    """
+    def __init__(self, recorder, system_prompt, user_template="{transcript}", speak=True,
+                 image_source=None, context_messages=CONTEXT_MESSAGES, speculation_window=None,
+                 rescore_model=None, spot_commands=False, echo_mode="gate", barge_in_threshold=None,
+                 preprocess=False):
+        if echo_mode not in ECHO_MODES:
+            raise ValueError(f"echo_mode must be one of {ECHO_MODES}")
+        self.recorder = recorder
+        self.system_prompt = system_prompt
+        self.user_template = user_template
+        self.speak = speak
+        self.image_source = image_source
+        self._image_version = 0
+        self.context_messages = context_messages
+        self.backend = get_tts_backend()
+        self.recognizer_pool = get_recognizer_pool(recorder.model, recorder.samplerate)
+        self.recognizer = self.recognizer_pool.checkout()
+        self.inbox = queue.Queue(maxsize=AUDIO_QUEUE_SIZE)
+        self.dropped_blocks = 0
+        self.transcripts = queue.Queue(maxsize=TRANSCRIPT_QUEUE_SIZE)
+        self.speech = queue.Queue(maxsize=SPEECH_QUEUE_SIZE)
+        self.outbox = queue.Queue()
+        self.synthesizer = ThreadPoolExecutor(max_workers=TTS_WORKERS)
+        self.messages = []
+        self.turn = 0
+        self.turn_metrics = []
+        self.state = "waiting"
+        self.state_lock = threading.Lock()
+        self.running = False
+        self.threads = []
+
+        # Speculative prefetch on stable partial transcripts
+        self.speculation_window = speculation_window
+        self.speculation = None
+        self.speculation_stats = {"started": 0, "committed": 0, "cancelled": 0}
+        self.turns_in_flight = 0
+        self._partial = ""
+        # Arrival time of the last block loud enough to be speech, the true end of the utterance
+        self._voiced_at = None
+        self._partial_since = 0.0
+
+        # Second-pass rescoring of finished utterances
+        self.rescorer = None
+        if rescore_model:
+            self.rescorer = Rescorer(self._on_rescored, rescore_model, recorder.samplerate)
+        self._utterance = deque(maxlen=int(MAX_UTTERANCE_SECONDS / BLOCK_DURATION))
+        self._user_messages = {}
+        self._rescored = {}
+        self.spotter = CommandSpotter(recorder.model, recorder.samplerate) if spot_commands else None
+
+        # Echo gating while our own speech plays
+        self.echo_mode = echo_mode
+        self.barge_in_threshold = barge_in_threshold
+        self._playback_until = 0.0
+        self._loud_blocks = 0
+        self._barged_turn = -1
+        self._spoken = deque(maxlen=8)
+        self.gated_blocks = 0
+        self.spurious_turns = 0
+        self.preprocessor = AudioPreprocessor(recorder.samplerate) if preprocess else None
+
+    def start(self):
+        self.running = True
+        self.recorder.add_listener(self._on_audio)
+        for stage in (self._asr_stage, self._llm_stage, self._delivery_stage):
+            thread = threading.Thread(target=stage, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.running = False
+        self.recorder.remove_listener(self._on_audio)
+        if self.speculation:
+            self.speculation.cancel()
+        for stage_queue in (self.inbox, self.transcripts, self.speech):
+            self._put_sentinel(stage_queue)
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5)
+        if not self.threads[0].is_alive():
+            self.recognizer_pool.checkin(self.recognizer)
+            if self.spotter:
+                self.spotter.close()
+        self.synthesizer.shutdown(wait=False)
+        if self.rescorer:
+            self.rescorer.shutdown()
+
+    def _put_sentinel(self, stage_queue):
+        """Wake a stage for shutdown, making room in a full queue if needed"""
+        while True:
+            try:
+                stage_queue.put_nowait(None)
+                return
+            except queue.Full:
+                try:
+                    stage_queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def say(self, text):
+        """Speak a fixed phrase, such as the greeting, through the delivery stage"""
+        self._spoken.append(text)
+        self._put(self.speech, ("audio", None, self.synthesizer.submit(play_audio, text, self.backend)))
+
+    def playing_until(self, ends):
+        """Tell the engine when the chunk that just started playing will end"""
+        with self.state_lock:
+            self._playback_until = max(self._playback_until, ends + ECHO_TAIL)
+
+    def poll(self, timeout=None):
+        """Return all pending events, waiting up to timeout for the first one"""
+        try:
+            events = [self.outbox.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                events.append(self.outbox.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _on_audio(self, block, timestamp):
+        """Audio thread hook: never block, drop the oldest block if recognition is behind"""
+        try:
+            self.inbox.put_nowait((block, timestamp))
+        except queue.Full:
+            self.dropped_blocks += 1
+            try:
+                self.inbox.get_nowait()
+                self.inbox.put_nowait((block, timestamp))
+            except (queue.Empty, queue.Full):
+                pass
+
+    def _put(self, stage_queue, item):
+        """Blocking put between stages that gives up once the engine stops"""
+        while self.running:
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _emit(self, kind, **data):
+        self.outbox.put({"type": kind, **data})
+
+    def _set_state(self, state):
+        with self.state_lock:
+            if state == self.state:
+                return
+            self.state = state
+        self._emit("state", state=state)
+
+    # Stage 1: streaming speech recognition
+    def _asr_stage(self):
+        while self.running:
+            event = self.inbox.get()
+            if event is None:
+                break
+            try:
+                self._on_block(*event)
+            except Exception as e:
+                self._emit("error", message=str(e))
+
+    def _on_block(self, block, timestamp):
+        """Feed one audio block to the recognizer, a final result ends the user's turn"""
+        if self.echo_mode != "off" and timestamp < self._playback_until:
+            block = self._gate(block)
+        if self.preprocessor:
+            block = self.preprocessor.process(block)
+        if len(block) and np.sqrt(np.mean(np.square(block))) >= SPEECH_THRESHOLD:
+            self._voiced_at = timestamp
+        pcm = (np.clip(block, -1.0, 1.0) * 32767).astype(np.int16)
+        if self.rescorer:
+            self._utterance.append(pcm)
+        if self.spotter:
+            command = self.spotter.feed(pcm)
+            if command:
+                self._dispatch(command, timestamp)
+        if self.recognizer.AcceptWaveform(pcm.tobytes()):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            self._partial = ""
+            # Vosk finalizes after about a second of silence, measure from the last speech instead
+            speech_end, self._voiced_at = self._voiced_at or timestamp, None
+            utterance = np.concatenate(self._utterance) if self._utterance else None
+            self._utterance.clear()
+            if text and self._is_echo(text, timestamp):
+                self.spurious_turns += 1
+                self._cancel_speculation()
+                if self.state == "listening":
+                    self._set_state("waiting")
+            elif text and self.spotter and self.spotter.is_command(text):
+                # Already handled by the spotter
+                self._cancel_speculation()
+                if self.state == "listening":
+                    self._set_state("waiting")
+            elif text:
+                self._start_turn(text, speech_end, utterance)
+            else:
+                self._cancel_speculation()
+                if self.state == "listening":
+                    self._set_state("waiting")
+        elif self.state == "waiting" or self.speculation_window:
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+            if partial and self.state == "waiting":
+                self._set_state("listening")
+            if self.speculation_window:
+                self._track_partial(partial, timestamp)
+
+    def _gate(self, block):
+        """Silence or attenuate mic input while our speech plays, unless the user barges in"""
+        if self.barge_in_threshold:
+            level = np.sqrt(np.mean(np.square(block)))
+            self._loud_blocks = self._loud_blocks + 1 if level >= self.barge_in_threshold else 0
+            if self._loud_blocks >= BARGE_IN_BLOCKS:
+                self._loud_blocks = 0
+                with self.state_lock:
+                    self._playback_until = 0.0
+                    self._barged_turn = self.turn
+                self._emit("barge_in", turn=self.turn)
+                return block
+        self.gated_blocks += 1
+        if self.echo_mode == "gate":
+            return np.zeros_like(block)
+        return block * ECHO_ATTENUATION
+
+    def _is_echo(self, text, timestamp):
+        """Whether a transcript is our own recent speech picked up by the mic"""
+        # Vosk finalizes an utterance about a second after the speech stops
+        if not self._spoken or timestamp > self._playback_until + 1.0:
+            return False
+        words = text.lower().split()
+        spoken = set(re.findall(r"[a-z']+", " ".join(self._spoken).lower()))
+        return len(words) > 1 and sum(w in spoken for w in words) / len(words) >= ECHO_OVERLAP
+
+    def _start_turn(self, text, timestamp, utterance=None):
+        self.turn += 1
+        self._emit("transcript", turn=self.turn, text=text)
+        if utterance is not None and self.rescorer:
+            self.rescorer.submit(self.turn, utterance)
+        self._set_state("processing")
+        trace = TurnTrace(self.turn, text, timestamp)
+        trace.speculation = self._take_speculation(text)
+        with self.state_lock:
+            self.turns_in_flight += 1
+        self._put(self.transcripts, trace)
+
+    def _dispatch(self, command, timestamp):
+        """Act on a spoken command without involving the LLM in detecting it"""
+        self._emit("command", command=command)
+        if command == "repeat":
+            replies = [m["content"] for m in self.messages if m["role"] == "assistant"]
+            if replies:
+                self.say(replies[-1])
+        elif command == "next":
+            self._cancel_speculation()
+            self._start_turn(NEXT_QUESTION_PROMPT, timestamp)
+
+    def _track_partial(self, partial, now):
+        """Start a speculative reply once the partial transcript stops changing"""
+        if partial != self._partial:
+            self._partial = partial
+            self._partial_since = now
+            if self.speculation and _normalize(self.speculation.transcript) != _normalize(partial):
+                self._cancel_speculation()
+        elif (partial and self.speculation is None and self.turns_in_flight == 0 and
+                now - self._partial_since >= self.speculation_window):
+            _, messages, images, image_version = self._build_messages(partial)
+            self.speculation = Speculation(partial, messages, images, len(self.messages), image_version)
+            self.speculation_stats["started"] += 1
+
+    def _take_speculation(self, transcript):
+        """Commit the running speculation if it answered this exact transcript"""
+        speculation, self.speculation = self.speculation, None
+        if speculation is None:
+            return None
+        if (_normalize(speculation.transcript) == _normalize(transcript) and
+                speculation.context_size == len(self.messages)):
+            self.speculation_stats["committed"] += 1
+            return speculation
+        speculation.cancel()
+        self.speculation_stats["cancelled"] += 1
+        return None
+
+    def _cancel_speculation(self):
+        if self.speculation:
+            self.speculation.cancel()
+            self.speculation = None
+            self.speculation_stats["cancelled"] += 1
+
+    def _on_rescored(self, turn, text, lag):
+        """Replace a turn's transcript with the large-model result"""
+        if not text:
+            return
+        with self.state_lock:
+            user_message = self._user_messages.get(turn)
+            if user_message:
+                user_message["content"] = self.user_template.format(transcript=text)
+            else:
+                # The reply is still generating, _generate picks this up
+                self._rescored[turn] = text
+        self._emit("transcript_rescored", turn=turn, text=text, lag_ms=_ms(lag))
+
+    def speculation_hit_rate(self):
+        """Share of started speculations that were committed"""
+        started = self.speculation_stats["started"]
+        return self.speculation_stats["committed"] / started if started else None
+
+    # Stage 2: reply generation, cut into sentences for synthesis
+    def _llm_stage(self):
+        while self.running:
+            trace = self.transcripts.get()
+            if trace is None:
+                break
+            try:
+                self._generate(trace)
+            except Exception as e:
+                self._emit("error", message=str(e))
+            finally:
+                with self.state_lock:
+                    self.turns_in_flight -= 1
+            # Marks the end of the turn for the delivery stage
+            self._put(self.speech, ("end", trace, None))
+
+    def _build_messages(self, transcript):
+        user_message = {"role": "user", "content": self.user_template.format(transcript=transcript)}
+        messages = [{"role": "system", "content": self.system_prompt}]
+        messages += self.messages[-self.context_messages:] + [user_message]
+        # Only screens the model has not seen yet, an unchanged screen costs no image tokens
+        new_image = self.image_source(self._image_version) if self.image_source else None
+        if new_image is None:
+            return user_message, messages, None, 0
+        version, image = new_image
+        return user_message, messages, [image], version
+
+    def _generate(self, trace):
+        trace.mark("llm_start")
+        user_message, messages, images, image_version = self._build_messages(trace.transcript)
+        if trace.speculation:
+            tokens = trace.speculation.stream()
+            image_version = trace.speculation.image_version
+        else:
+            tokens = generate_gpt_response_with_history(messages, images=images)
+
+        splitter = SentenceSplitter()
+        reply = ""
+        for token in tokens:
+            if not self.running:
+                return
+            if not reply:
+                trace.mark("first_token")
+                self._set_state("responding")
+            reply += token
+            self._emit("reply_delta", turn=trace.turn, text=token)
+            if self.speak:
+                for sentence in splitter.feed(token):
+                    self._queue_sentence(trace, sentence)
+        trace.mark("llm_done")
+        if self.speak:
+            for sentence in splitter.flush():
+                self._queue_sentence(trace, sentence)
+
+        with self.state_lock:
+            # Later turns see the rescored transcript, even if it arrived mid-reply
+            if trace.turn in self._rescored:
+                user_message["content"] = self.user_template.format(transcript=self._rescored.pop(trace.turn))
+            if self.rescorer:
+                self._user_messages[trace.turn] = user_message
+        self.messages += [user_message, {"role": "assistant", "content": reply}]
+        self._image_version = max(self._image_version, image_version)
+        self._emit("reply", turn=trace.turn, text=reply)
+
+    def _queue_sentence(self, trace, sentence):
+        trace.mark("first_sentence")
+        self._spoken.append(sentence)
+        # Blocks when delivery falls behind, which pauses reading the LLM stream
+        self._put(self.speech, ("audio", trace, self.synthesizer.submit(self.backend.synthesize, sentence)))
+
+    # Stage 3: in-order delivery of synthesized audio to the UI
+    def _delivery_stage(self):
+        while self.running:
+            item = self.speech.get()
+            if item is None:
+                break
+            kind, trace, future = item
+            try:
+                if kind == "audio":
+                    audio = future.result()
+                    if audio and trace and trace.turn <= self._barged_turn:
+                        continue
+                    if audio:
+                        if trace:
+                            trace.mark("first_audio")
+                        self._emit_audio(audio, trace.turn if trace else 0)
+                else:
+                    trace.mark("delivered")
+                    metrics = trace.breakdown()
+                    metrics["speculation_hit_rate"] = self.speculation_hit_rate()
+                    metrics["spurious_turns"] = self.spurious_turns
+                    metrics["gated_blocks"] = self.gated_blocks
+                    metrics["dropped_blocks"] = self.dropped_blocks
+                    self.turn_metrics.append(metrics)
+                    self._emit("metrics", **metrics)
+                    if self.transcripts.empty():
+                        self._set_state("waiting")
+            except Exception as e:
+                self._emit("error", message=str(e))
+
+    def _emit_audio(self, audio, turn):
+        duration = self.backend.duration(audio)
+        # Chunks play back to back, so this one starts when the previous one ends
+        with self.state_lock:
+            start = max(time.monotonic(), self._playback_until - ECHO_TAIL)
+            self._playback_until = start + duration + ECHO_TAIL
+        self._emit("audio", turn=turn, audio=audio, mime=self.backend.mime, duration=duration)
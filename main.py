@@ -7,16 +7,26 @@ import tempfile
 import os
 import atexit
 import random
-import numpy as np
 from openai_utils import generate_gpt_response_with_history
-from speech_utils import record_audio, transcribe_audio, AudioRecorder
+from speech_utils import record_answer, AudioRecorder, LARGE_MODEL_PATH, model_registry
 from feedback_utils import analyze_response
-from screen_utils import ScreenShareManager
-from audio_utils import play_audio
+from screen_utils import ScreenShareManager, FrameEncoder
+from recording_utils import SessionRecorder
+from audio_utils import speech_cache
+from interview_engine import InterviewEngine
 
 # Constants
 MAX_HISTORY_LENGTH = 20
-AUDIO_TIMEOUT = 30  # seconds
+# Seconds a partial transcript must stay unchanged before a reply is prefetched (0 disables)
+SPECULATION_WINDOW = float(os.getenv("SPECULATION_WINDOW", "0.6"))
+SPECULATIVE_FEATURES = ["Mock Interview Assistant", "Interview Cracker"]
+ECHO_MODE = os.getenv("ECHO_MODE", "gate")
+BARGE_IN_THRESHOLD = float(os.getenv("BARGE_IN_THRESHOLD", "0")) or None
+NOISE_SUPPRESSION = os.getenv("NOISE_SUPPRESSION", "0") == "1"
+LEVEL_METER_INTERVAL = 0.1
+ANSWER_POLL_INTERVAL = 0.5
+PANEL_REFRESH = 0.2  # seconds between interview panel refreshes, also the longest gap between speech chunks
+DEFAULT_GREETING = "Let's begin the interview."
 FEATURE_CONFIG = {
     "Mock Interview Assistant": {
         "system_prompt": "You are a professional interview coach. Ask insightful follow-up questions and provide constructive feedback. Ask one question at a time and wait for the response.",
@@ -72,6 +82,26 @@ st.set_page_config(
 )
 st.title("🧠 AI Career Coach Pro")
 
+# Fixed phrases spoken by the app, synthesized once at startup
+FIXED_PROMPTS = [config["greeting"] for config in FEATURE_CONFIG.values()] + [DEFAULT_GREETING]
+
+@st.cache_resource(show_spinner=False)
+def precompute_speech():
+    thread = threading.Thread(target=speech_cache.precompute, args=(FIXED_PROMPTS,), daemon=True)
+    thread.start()
+    return thread
+
+precompute_speech()
+
+@st.cache_resource(show_spinner=False)
+def preload_models():
+    """Load the models named in VOSK_PRELOAD once per server, in the background"""
+    thread = threading.Thread(target=model_registry.preload, daemon=True)
+    thread.start()
+    return thread
+
+preload_models()
+
 # Initialize all session state variables
 def init_session_state():
     defaults = {
@@ -80,10 +110,24 @@ def init_session_state():
         "screen_shared": False,
         "audio_recorder": None,
         "screen_manager": None,
+        "interview_engine": None,
+        "audio_queue": [],
+        "now_playing": None,
+        "current_reply": "",
+        "turn_metrics": None,
+        "transcript_rows": {},
+        "rescore_lag_ms": None,
+        "frame_encoder": None,
+        "record_session": False,
+        "session_recorder": None,
         "last_transcript": "",
         "conversation_state": "waiting",
         "active_feature": None,
         "temp_files": [],
+        "answer_recording": None,
+        "answer_question": "",
+        "qa_content": "",
+        "qa_feedback": "",
         "behavioral_questions": [
             "Tell me about a time you faced a conflict at work",
             "Describe a situation where you showed leadership",
@@ -155,9 +199,17 @@ def save_message(role, content, feature=None):
             VALUES (?, ?, ?, ?)
         """, (datetime.datetime.now().isoformat(), role, content_str, feature))
         conn.commit()
+        return cursor.lastrowid
     except sqlite3.Error as e:
         st.error(f"Failed to save message: {e}")
 
+def update_message(message_id, content):
+    try:
+        cursor.execute("UPDATE history SET content = ? WHERE id = ?", (str(content), message_id))
+        conn.commit()
+    except sqlite3.Error as e:
+        st.error(f"Failed to update message: {e}")
+
 def get_history(feature=None, limit=MAX_HISTORY_LENGTH):
     try:
         if feature:
@@ -190,59 +242,174 @@ def cleanup_temp_files():
         except Exception as e:
             st.error(f"Error cleaning up temp file {file}: {e}")
 
-def safe_play_audio(text, audio_file):
-    try:
-        play_audio(text, audio_file)
-        st.session_state.temp_files.append(audio_file)
-        st.audio(audio_file, format='audio/wav')
-    except Exception as e:
-        st.error(f"Error generating speech: {e}")
+def handle_engine_event(event, feature):
+    """Apply one interview engine event to the session, on the script thread"""
+    kind = event["type"]
+    if kind == "state":
+        st.session_state.conversation_state = event["state"]
+    elif kind == "transcript":
+        st.session_state.last_transcript = event["text"]
+        st.session_state.current_reply = ""
+        message = {"role": "user", "content": event["text"]}
+        st.session_state.history.append(message)
+        st.session_state.transcript_rows[event["turn"]] = (message, save_message("user", event["text"], feature))
+    elif kind == "transcript_rescored":
+        message, row_id = st.session_state.transcript_rows.pop(event["turn"], (None, None))
+        if message:
+            if st.session_state.last_transcript == message["content"]:
+                st.session_state.last_transcript = event["text"]
+            message["content"] = event["text"]
+        if row_id:
+            update_message(row_id, event["text"])
+        st.session_state.rescore_lag_ms = event["lag_ms"]
+    elif kind == "reply_delta":
+        st.session_state.current_reply += event["text"]
+    elif kind == "reply":
+        st.session_state.current_reply = event["text"]
+        st.session_state.history.append({"role": "assistant", "content": event["text"]})
+        save_message("assistant", event["text"], feature)
+        if feature == "Speech Speed Analyzer":
+            st.session_state.speech_analysis_data = event["text"]
+    elif kind == "audio":
+        st.session_state.audio_queue.append(event)
+    elif kind == "metrics":
+        st.session_state.turn_metrics = event
+    elif kind == "barge_in":
+        st.session_state.audio_queue = []
+        st.session_state.now_playing = None
+    elif kind == "command":
+        st.toast(f"Voice command: {event['command']}")
+        if event["command"] == "end":
+            stop_interview()
+            st.rerun()
+    elif kind == "error":
+        st.error(f"Interview error: {event['message']}")
 
-def process_interview_question(question, feature):
-    if feature not in FEATURE_CONFIG:
-        st.error("Invalid feature configuration")
+def show_speech_analysis():
+    if not st.session_state.speech_analysis_data:
         return
+    st.subheader("Analysis Results")
+    st.markdown(st.session_state.speech_analysis_data)
+    
+    # Visualization of speech metrics
+    st.subheader("Speech Metrics")
+    col1, col2, col3 = st.columns(3)
     
-    st.session_state.conversation_state = "responding"
-    response = ""
+    # Sample metrics (in a real app, these would come from actual analysis)
+    col1.metric("Words per Minute", "145", "-5 from ideal")
+    col2.metric("Pause Frequency", "3.2/sec", "High")
+    col3.metric("Filler Words", "12%", "8% over target")
     
-    with st.chat_message("assistant"):
-        placeholder = st.empty()
-        messages = [{"role": "user", "content": question}]
+    st.progress(65, text="Overall Speech Score")
+
+@st.fragment(run_every=PANEL_REFRESH)
+def interview_panel(feature):
+    """Show the live interview, refreshed every PANEL_REFRESH seconds without rerunning the app"""
+    engine = st.session_state.interview_engine
+    if engine is None:
+        return
+    
+    # Never wait here: this also runs as part of every full-app run
+    for event in engine.poll(0):
+        handle_engine_event(event, feature)
+    playing = st.session_state.now_playing  # a barge-in stops playback
+    
+    now = time.monotonic()
+    if st.session_state.audio_queue and (playing is None or now >= playing["ends"]):
+        event = st.session_state.audio_queue.pop(0)
+        playing = {"audio": event["audio"], "mime": event["mime"], "ends": now + event["duration"]}
+        st.session_state.now_playing = playing
+        engine.playing_until(playing["ends"])
+    
+    states = {
+        "waiting": "🟢 Ready for your response",
+        "listening": "🎤 Listening...",
+        "processing": "🤔 Processing your answer...",
+        "responding": "💬 AI is responding"
+    }
+    st.info(states.get(st.session_state.conversation_state, "🟠 Unknown state"))
+    
+    # Keep the player at a fixed position so reruns don't restart playback
+    if playing and now < playing["ends"]:
+        st.audio(playing["audio"], format=playing["mime"], autoplay=True)
+    if st.session_state.last_transcript:
+        with st.chat_message("user"):
+            st.markdown(st.session_state.last_transcript)
+    if st.session_state.current_reply:
+        with st.chat_message("assistant"):
+            st.markdown(st.session_state.current_reply)
+    
+    metrics = st.session_state.turn_metrics
+    if metrics:
+        stages = [
+            ("transcript", "asr_ms"),
+            ("queued", "queue_ms"),
+            ("first token", "first_token_ms"),
+            ("first sentence", "first_sentence_ms"),
+            ("speech", "tts_ms"),
+            ("first audio", "first_audio_ms"),
+            ("turn", "turn_ms"),
+        ]
+        caption = f"Turn {metrics['turn']} latency: " + " · ".join(
+            f"{label} {metrics[key]} ms" for label, key in stages if metrics.get(key) is not None
+        )
+        if metrics.get("speculation_hit_rate") is not None:
+            caption += f" · prefetch {'hit' if metrics['speculative'] else 'miss'}, hit rate {metrics['speculation_hit_rate']:.0%}"
+        if metrics.get("spurious_turns"):
+            caption += f" · echo turns dropped {metrics['spurious_turns']}"
+        if st.session_state.rescore_lag_ms is not None:
+            caption += f" · rescoring lag {st.session_state.rescore_lag_ms} ms"
+        st.caption(caption)
+    
+    if feature == "Speech Speed Analyzer":
+        show_speech_analysis()
+
+@st.fragment(run_every=ANSWER_POLL_INTERVAL)
+def answer_feedback():
+    """Wait for the practice answer on fragment reruns, then evaluate it"""
+    recording = st.session_state.answer_recording
+    if recording is not None:
+        if not recording.done():
+            st.info("🎤 Listening... recording stops when you pause")
+            return
+        st.session_state.answer_recording = None
+        try:
+            transcript = recording.result()
+        except Exception as e:
+            st.error(f"Recording failed: {e}")
+            return
+        if not transcript:
+            st.warning("No speech detected, please try again.")
+            return
+        st.session_state.user_answer = transcript
         
-        if feature in FEATURE_CONFIG:
-            messages.insert(0, {
-                "role": "system", 
-                "content": FEATURE_CONFIG[feature]["system_prompt"]
-            })
+        feedback_prompt = f"Evaluate this answer to '{st.session_state.answer_question}':\n{transcript}\n\nProvide specific feedback on content, structure, and delivery."
         
-        try:
-            full_response = ""
-            for chunk in generate_gpt_response_with_history(messages):
+        feedback = ""
+        with st.spinner("Evaluating your answer..."):
+            for chunk in generate_gpt_response_with_history([{"role": "user", "content": feedback_prompt}]):
                 if isinstance(chunk, str):
-                    full_response += chunk
-                else:
-                    full_response += str(chunk)
-            
-            placeholder.markdown(full_response)
-            response = full_response
-        except Exception as e:
-            st.error(f"Error generating response: {e}")
-            response = "I encountered an error processing your request. Please try again."
-            placeholder.markdown(response)
+                    feedback += chunk
+        st.session_state.qa_feedback = feedback
+        save_message("user", transcript, "Interview Q&A Generator")
+        save_message("assistant", feedback, "Interview Q&A Generator")
     
-    st.session_state.history.append({"role": "assistant", "content": response})
-    save_message("assistant", response, feature)
-    
-    try:
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmpfile:
-            audio_file = tmpfile.name
-            safe_play_audio(response, audio_file)
-    except Exception as e:
-        st.error(f"Error creating audio file: {e}")
-    
-    st.session_state.conversation_state = "waiting"
-    st.rerun()
+    if st.session_state.qa_feedback:
+        st.write("**Your answer:**", st.session_state.user_answer)
+        st.write("**Feedback:**", st.session_state.qa_feedback)
+
+@st.fragment(run_every=LEVEL_METER_INTERVAL)
+def level_meter():
+    """Microphone level, refreshed independently of the conversation"""
+    recorder = st.session_state.audio_recorder
+    levels = recorder.get_levels() if recorder else None
+    if levels is None or levels["age"] > 1.0:
+        st.warning("🎙️ No audio from the microphone")
+        return
+    st.progress(min(1.0, max(0.0, (levels["rms_dbfs"] + 60) / 60)),
+                text=f"🎙️ Mic level {levels['rms_dbfs']:.0f} dBFS, peak {levels['peak_dbfs']:.0f} dBFS")
+    if levels["clip_ratio"] > 0.001:
+        st.caption("⚠️ Input is clipping, lower the microphone gain")
 
 # Enhanced interview functions for real-time interaction
 def start_interview(feature):
@@ -253,66 +420,67 @@ def start_interview(feature):
     try:
         st.session_state.interview_active = True
         st.session_state.active_feature = feature
-        st.session_state.audio_recorder = AudioRecorder()
+        # The engine and session recorder take blocks through listeners, not the queue
+        st.session_state.audio_recorder = AudioRecorder(buffered=False)
         st.session_state.audio_recorder.start()
         
-        threading.Thread(
-            target=interview_thread, 
-            args=(feature,),
-            daemon=True
-        ).start()
+        if st.session_state.record_session and st.session_state.screen_manager:
+            st.session_state.session_recorder = SessionRecorder(
+                st.session_state.screen_manager,
+                st.session_state.audio_recorder
+            )
+            st.session_state.session_recorder.start()
+        
+        analyzer = feature == "Speech Speed Analyzer"
+        frame_encoder = st.session_state.frame_encoder
+        engine = InterviewEngine(
+            st.session_state.audio_recorder,
+            FEATURE_CONFIG[feature]["system_prompt"],
+            user_template="Analyze this speech:\n{transcript}" if analyzer else "{transcript}",
+            speak=not analyzer,
+            image_source=frame_encoder.new_image_content if frame_encoder else None,
+            speculation_window=SPECULATION_WINDOW if feature in SPECULATIVE_FEATURES and SPECULATION_WINDOW > 0 else None,
+            rescore_model=LARGE_MODEL_PATH,
+            spot_commands=not analyzer,
+            echo_mode=ECHO_MODE,
+            barge_in_threshold=BARGE_IN_THRESHOLD,
+            preprocess=NOISE_SUPPRESSION
+        )
+        st.session_state.interview_engine = engine
+        st.session_state.audio_queue = []
+        st.session_state.now_playing = None
+        st.session_state.current_reply = ""
+        st.session_state.transcript_rows = {}
+        st.session_state.rescore_lag_ms = None
+        engine.start()
         
-        greeting = FEATURE_CONFIG[feature].get("greeting", "Let's begin the interview.")
+        greeting = FEATURE_CONFIG[feature].get("greeting", DEFAULT_GREETING)
         
         st.session_state.history.append({"role": "assistant", "content": greeting})
         save_message("assistant", greeting, feature)
-        
-        with st.chat_message("assistant"):
-            st.markdown(greeting)
-        
-        try:
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmpfile:
-                audio_file = tmpfile.name
-                safe_play_audio(greeting, audio_file)
-        except Exception as e:
-            st.error(f"Error generating greeting: {e}")
+        st.session_state.current_reply = greeting
+        engine.say(greeting)
         
         st.rerun()
     except Exception as e:
         st.error(f"Failed to start interview: {e}")
         stop_interview()
 
-def interview_thread(feature):
-    start_time = time.time()
-    
-    while (st.session_state.interview_active and 
-           st.session_state.active_feature == feature and
-           time.time() - start_time < AUDIO_TIMEOUT * 10):  # Increased timeout for longer sessions
-        
-        try:
-            if st.session_state.conversation_state == "waiting":
-                st.session_state.conversation_state = "listening"
-                
-                audio_data = st.session_state.audio_recorder.get_audio_data()
-                if audio_data is not None and len(audio_data) > 0:
-                    transcript = transcribe_audio(audio_data)
-                    
-                    if transcript and transcript != st.session_state.last_transcript:
-                        st.session_state.last_transcript = transcript
-                        st.session_state.history.append({"role": "user", "content": transcript})
-                        save_message("user", transcript, feature)
-                        
-                        # Real-time analysis of speech patterns
-                        if feature == "Speech Speed Analyzer":
-                            analyze_speech_patterns(transcript)
-                        
-                        st.session_state.conversation_state = "processing"
-                        st.rerun()
-            
-            time.sleep(0.5)
-        except Exception as e:
-            st.error(f"Interview thread error: {e}")
-            break
+def stop_interview():
+    try:
+        st.session_state.interview_active = False
+        st.session_state.conversation_state = "waiting"
+        if st.session_state.interview_engine:
+            st.session_state.interview_engine.stop()
+            st.session_state.interview_engine = None
+        if st.session_state.session_recorder:
+            st.session_state.session_recorder.stop()
+            st.session_state.session_recorder = None
+        if st.session_state.audio_recorder:
+            st.session_state.audio_recorder.stop()
+            st.session_state.audio_recorder = None
+    except Exception as e:
+        st.error(f"Error stopping interview: {e}")
 
 # New feature functions
 def generate_cover_letter():
@@ -443,6 +611,10 @@ with col1:
             if st.button("🖥️ Share Your Screen"):
                 try:
                     st.session_state.screen_manager = ScreenShareManager()
+                    st.session_state.screen_manager.start()
+                    # Keyframes of the shared screen go along with each question to the model
+                    st.session_state.frame_encoder = FrameEncoder(st.session_state.screen_manager)
+                    st.session_state.frame_encoder.start()
                     st.session_state.screen_shared = True
                     st.success("Screen sharing initialized!")
                     st.rerun()
@@ -450,10 +622,17 @@ with col1:
                     st.error(f"Failed to initialize screen sharing: {e}")
         else:
             st.success("✅ Screen sharing is active")
+            st.session_state.record_session = st.checkbox(
+                "🎞️ Record the session for later review",
+                value=st.session_state.record_session,
+                disabled=st.session_state.interview_active
+            )
             if st.button("🛑 Stop Screen Sharing"):
                 try:
+                    st.session_state.frame_encoder.stop()
                     st.session_state.screen_manager.stop()
                     st.session_state.screen_shared = False
+                    st.session_state.frame_encoder = None
                     st.session_state.screen_manager = None
                     st.rerun()
                 except Exception as e:
@@ -466,21 +645,10 @@ with col1:
             if st.session_state.active_feature == app_mode:
                 if st.button("⏹️ End Session"):
                     stop_interview()
+                    st.rerun()
                 
-                states = {
-                    "waiting": "🟢 Ready for your response",
-                    "listening": "🎤 Listening...",
-                    "processing": "🤔 Processing your answer...",
-                    "responding": "💬 AI is responding"
-                }
-                current_state = st.session_state.conversation_state
-                st.info(states.get(current_state, "🟠 Unknown state"))
-                
-                if current_state == "processing":
-                    process_interview_question(
-                        st.session_state.last_transcript, 
-                        app_mode
-                    )
+                level_meter()
+                interview_panel(app_mode)
     
     # Cover Letter Generator Feature
     elif app_mode == "Cover Letter Generator":
@@ -553,40 +721,27 @@ with col1:
                         
                         st.session_state.history.append({"role": "assistant", "content": qa_content})
                         save_message("assistant", qa_content, "Interview Q&A Generator")
-                        
-                        st.markdown(qa_content)
-                        
-                        # Add practice section
-                        st.subheader("Practice Your Answers")
-                        st.markdown("Select a question to practice answering:")
-                        
-                        questions = [q for q in qa_content.split("\n") if q.strip() and (q.startswith("1.") or "?" in q)]
-                        selected_q = st.selectbox("Select a question:", questions)
-                        
-                        if st.button("Record My Answer"):
-                            audio_file = record_audio()
-                            if isinstance(audio_file, np.ndarray):
-                                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmpfile:
-                                    import soundfile as sf
-                                    sf.write(tmpfile.name, audio_file, 16000)
-                                    audio_file = tmpfile.name
-                                    st.session_state.temp_files.append(audio_file)
-                            
-                            transcript = transcribe_audio(audio_file)
-                            st.session_state.user_answer = transcript
-                            
-                            feedback_prompt = f"Evaluate this answer to '{selected_q}':\n{transcript}\n\nProvide specific feedback on content, structure, and delivery."
-                            
-                            feedback = ""
-                            for chunk in generate_gpt_response_with_history([{"role": "user", "content": feedback_prompt}]):
-                                if isinstance(chunk, str):
-                                    feedback += chunk
-                            
-                            st.write("**Feedback:**", feedback)
-                            save_message("user", transcript, "Interview Q&A Generator")
-                            save_message("assistant", feedback, "Interview Q&A Generator")
+                        st.session_state.qa_content = qa_content
+                        st.session_state.qa_feedback = ""
                     except Exception as e:
                         st.error(f"Error generating Q&A: {e}")
+        
+        if st.session_state.qa_content:
+            st.markdown(st.session_state.qa_content)
+            
+            # Add practice section
+            st.subheader("Practice Your Answers")
+            st.markdown("Select a question to practice answering:")
+            
+            questions = [q for q in st.session_state.qa_content.split("\n") if q.strip() and (q.startswith("1.") or "?" in q)]
+            selected_q = st.selectbox("Select a question:", questions)
+            
+            if st.button("Record My Answer", disabled=st.session_state.answer_recording is not None):
+                # Recording runs in the background and is transcribed as it goes
+                st.session_state.answer_recording = record_answer()
+                st.session_state.answer_question = selected_q
+                st.session_state.qa_feedback = ""
+            answer_feedback()
 
     # Grammar & Tone Enhancer Feature
     elif app_mode == "Grammar & Tone Enhancer":
@@ -626,23 +781,11 @@ with col1:
             if st.session_state.active_feature == app_mode:
                 if st.button("Stop Analysis"):
                     stop_interview()
+                    st.rerun()
                 
                 st.info("🎤 Recording your speech... Speak naturally")
-                
-                if st.session_state.speech_analysis_data:
-                    st.subheader("Analysis Results")
-                    st.markdown(st.session_state.speech_analysis_data)
-                    
-                    # Visualization of speech metrics
-                    st.subheader("Speech Metrics")
-                    col1, col2, col3 = st.columns(3)
-                    
-                    # Sample metrics (in a real app, these would come from actual analysis)
-                    col1.metric("Words per Minute", "145", "-5 from ideal")
-                    col2.metric("Pause Frequency", "3.2/sec", "High")
-                    col3.metric("Filler Words", "12%", "8% over target")
-                    
-                    st.progress(65, text="Overall Speech Score")
+                level_meter()
+                interview_panel(app_mode)
 
     # Job Match Finder Feature
     elif app_mode == "Job Match Finder":
@@ -835,8 +978,16 @@ with col2:
 # Cleanup handler (unchanged)
 def cleanup():
     try:
+        if st.session_state.get("interview_engine"):
+            st.session_state.interview_engine.stop()
+        if st.session_state.get("session_recorder"):
+            st.session_state.session_recorder.stop()
         if st.session_state.get("audio_recorder"):
             st.session_state.audio_recorder.stop()
+        if st.session_state.get("answer_recording"):
+            st.session_state.answer_recording.stop()
+        if st.session_state.get("frame_encoder"):
+            st.session_state.frame_encoder.stop()
         if st.session_state.get("screen_manager"):
             st.session_state.screen_manager.stop()
         cleanup_temp_files()
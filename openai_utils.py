@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+DEFAULT_MODEL = "gpt-4"
+VISION_MODEL = os.getenv("OPENAI_VISION_MODEL", "gpt-4o")
 
 # Basic GPT response
 def generate_gpt_response(prompt, model="gpt-4"):
@@ -20,11 +22,25 @@ def generate_gpt_response(prompt, model="gpt-4"):
     except Exception as e:
         return f"❌ Error: {str(e)}"
 
+# Attach image content parts (e.g. screen keyframes) to the last user message
+def attach_images(messages: list, images: list):
+    messages = list(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i]["role"] == "user":
+            content = messages[i]["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            messages[i] = {**messages[i], "content": content + list(images)}
+            break
+    return messages
+
 # Streaming GPT response with memory/history
-def generate_gpt_response_with_history(messages: list, model="gpt-4"):
+def generate_gpt_response_with_history(messages: list, model=None, images=None):
     try:
+        if images:
+            messages = attach_images(messages, images)
         response = client.chat.completions.create(
-            model=model,
+            model=model or (VISION_MODEL if images else DEFAULT_MODEL),
             messages=messages,
             stream=True,
         )
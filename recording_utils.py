@@ -0,0 +1,217 @@
+import cv2
+import numpy as np
+import soundfile as sf
+import subprocess
+import threading
+import shutil
+import queue
+import json
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+SEGMENT_SECONDS = 60
+FRAME_QUEUE_SIZE = 30    # frames buffered before the oldest are dropped
+AUDIO_QUEUE_SIZE = 200   # audio blocks buffered before new ones are dropped
+AUDIO_JITTER = 0.05      # seconds of timestamp jitter tolerated before re-aligning audio
+
+class _Segment:
+    """One video file (plus WAV sidecar) covering a fixed time span"""
+    def __init__(self, base_path, start, fps, fourcc, last_image=None, samplerate=None, channels=1):
+        self.base_path = base_path
+        self.start = start
+        self.fps = fps
+        self.fourcc = fourcc
+        self.video_path = base_path + ".mp4"
+        self.audio_path = base_path + ".wav" if samplerate else None
+        self.writer = None
+        self.size = None
+        self.last = None
+        self.frames_written = 0
+        self.samplerate = samplerate
+        self.audio = sf.SoundFile(self.audio_path, "w", samplerate, channels, subtype="PCM_16") if samplerate else None
+        self.audio_pos = 0
+        if last_image is not None:
+            self._set_last(last_image)
+
+    def _set_last(self, image):
+        if self.writer is None:
+            self.size = (image.shape[1], image.shape[0])
+            self.writer = cv2.VideoWriter(self.video_path, self.fourcc, self.fps, self.size)
+        if (image.shape[1], image.shape[0]) != self.size:
+            # Adaptive capture may change the frame size mid-segment
+            image = cv2.resize(image, self.size, interpolation=cv2.INTER_AREA)
+        self.last = image
+
+    def _fill(self, index):
+        """Repeat the last frame up to (not including) frame index"""
+        while self.last is not None and self.frames_written < index:
+            self.writer.write(self.last)
+            self.frames_written += 1
+
+    def add_frame(self, frame):
+        index = max(0, int((frame.timestamp - self.start) * self.fps))
+        self._fill(index)
+        self._set_last(frame.image)
+
+    def add_audio(self, block, timestamp):
+        if self.audio is None:
+            return
+        block_start = timestamp - len(block) / self.samplerate
+        offset = int(round((block_start - self.start) * self.samplerate))
+        drift = offset - self.audio_pos
+        if abs(drift) > AUDIO_JITTER * self.samplerate:
+            if drift > 0:
+                # Blocks were dropped: keep alignment with silence
+                self.audio.write(np.zeros((drift,) + block.shape[1:], dtype=block.dtype))
+                self.audio_pos += drift
+            else:
+                block = block[-drift:]
+        self.audio.write(block)
+        self.audio_pos += len(block)
+
+    def close(self, end):
+        self._fill(max(1, int((end - self.start) * self.fps)))
+        if self.writer is not None:
+            self.writer.release()
+        if self.audio is not None:
+            self.audio.close()
+        return self.last
+
+# Screen-share session recorder
+class SessionRecorder:
+    """Record shared-screen frames and mic audio to segmented video files.
+
+    Encoding runs in a background thread fed by a bounded frame bus
+    subscription, so a slow disk or codec drops frames instead of blocking
+    capture. Audio is written with timestamps aligned to the frames and,
+    when ffmpeg is available, muxed into each finished segment.
+    """
+    def __init__(self, manager, audio_recorder=None, output_dir="recordings",
+                 segment_seconds=SEGMENT_SECONDS, fps=None, codec="mp4v"):
+        self.manager = manager
+        self.audio_recorder = audio_recorder
+        self.output_dir = output_dir
+        self.segment_seconds = segment_seconds
+        self.fps = fps or manager.fps
+        self.fourcc = cv2.VideoWriter_fourcc(*codec)
+        self.session_id = time.strftime("%Y%m%d-%H%M%S")
+        self.running = False
+        self.thread = None
+        self.subscription = None
+        self.audio_queue = queue.Queue(maxsize=AUDIO_QUEUE_SIZE)
+        self.audio_blocks_dropped = 0
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.muxer = ThreadPoolExecutor(max_workers=1)
+        self.segments = []
+        self.started_at = None
+        self._segment = None
+        self._first_image = None
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.started_at = time.monotonic()
+        self.running = True
+        self.subscription = self.manager.bus.subscribe(maxsize=FRAME_QUEUE_SIZE)
+        # The bus publishes only on change, so a static screen shared before
+        # the recording starts would otherwise never reach the video
+        if self.manager.get_frame_version() > 0:
+            self._first_image = self.manager.get_frame().copy()
+        if self.audio_recorder:
+            self.audio_recorder.add_listener(self._on_audio)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.audio_recorder:
+            self.audio_recorder.remove_listener(self._on_audio)
+        if self.subscription:
+            self.subscription.close()
+        if self.thread:
+            self.thread.join()
+        self.muxer.shutdown(wait=True)
+        self._write_manifest()
+
+    def _on_audio(self, block, timestamp):
+        """Audio thread hook: never block, drop the block if the writer is behind"""
+        try:
+            self.audio_queue.put_nowait((block, timestamp))
+        except queue.Full:
+            self.audio_blocks_dropped += 1
+
+    def _run(self):
+        try:
+            self._open_segment(self.started_at, self._first_image)
+            while self.running:
+                frame = self.subscription.get(timeout=0.1)
+                self._drain_audio()
+                segment_end = self._segment.start + self.segment_seconds
+                if time.monotonic() >= segment_end:
+                    self._open_segment(segment_end, self._close_segment(segment_end))
+                if frame is not None:
+                    self._segment.add_frame(frame)
+        except Exception as e:
+            print(f"Session recording error: {e}")
+        finally:
+            if self._segment is not None:
+                self._drain_audio()
+                self._close_segment(time.monotonic())
+
+    def _drain_audio(self):
+        while True:
+            try:
+                block, timestamp = self.audio_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._segment.add_audio(block, timestamp)
+
+    def _open_segment(self, start, last_image=None):
+        base_path = os.path.join(self.output_dir, f"{self.session_id}_{len(self.segments):03d}")
+        samplerate = self.audio_recorder.samplerate if self.audio_recorder else None
+        channels = self.audio_recorder.channels if self.audio_recorder else 1
+        self._segment = _Segment(base_path, start, self.fps, self.fourcc, last_image, samplerate, channels)
+
+    def _close_segment(self, end):
+        segment = self._segment
+        last_image = segment.close(end)
+        info = {
+            "video": segment.video_path,
+            "audio": segment.audio_path,
+            "offset": round(segment.start - self.started_at, 3),
+            "duration": round(end - segment.start, 3),
+            "frames": segment.frames_written,
+        }
+        self.segments.append(info)
+        self._segment = None
+        if segment.writer is None:
+            info["video"] = None
+        elif self.ffmpeg and segment.audio_path:
+            self.muxer.submit(self._mux, info)
+        return last_image
+
+    def _mux(self, info):
+        """Combine a segment's video and audio, keeping the sources if ffmpeg fails"""
+        output = info["video"][:-len(".mp4")] + "_av.mp4"
+        result = subprocess.run(
+            [self.ffmpeg, "-y", "-loglevel", "error", "-i", info["video"], "-i", info["audio"],
+             "-c:v", "copy", "-c:a", "aac", "-shortest", output],
+            capture_output=True
+        )
+        if result.returncode == 0:
+            os.remove(info["video"])
+            os.remove(info["audio"])
+            info.update(video=output, audio=None)
+        else:
+            print(f"Muxing failed for {output}: {result.stderr.decode(errors='ignore')}")
+
+    def _write_manifest(self):
+        manifest = {
+            "session": self.session_id,
+            "fps": self.fps,
+            "segments": self.segments,
+            "audio_blocks_dropped": self.audio_blocks_dropped,
+            "frames_dropped": self.subscription.dropped if self.subscription else 0,
+        }
+        with open(os.path.join(self.output_dir, f"{self.session_id}.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
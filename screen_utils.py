@@ -1,43 +1,679 @@
-import pyautogui
 import cv2
 import numpy as np
+import sys
 import threading
+import base64
+from collections import deque, namedtuple
 import time
+import os
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+TILE_SIZE = 64  # pixels per side of a dirty-region tile
+HASH_STEP = 4   # fingerprint tiles averaged down by 4 in each direction
+# Above this share of dirty tiles a full-frame conversion beats per-tile copies
+FULL_UPDATE_RATIO = 0.5
+SNAPSHOT_POOL_SIZE = 4  # reusable frame buffers handed to bus subscribers
+STATS_SMOOTHING = 0.1  # weight of the newest sample in the moving averages
+
+# Adaptive rate control: degrade when a frame's work exceeds its budget
+WORK_BUDGET = 0.8      # share of the frame period capture and processing may use
+RECOVER_BUDGET = 0.5   # step back up once work fits this share of the faster period
+ADAPT_INTERVAL = 15    # frames between adaptation decisions
+ADAPT_FACTOR = 0.75    # multiplicative step for fps and resolution scale
+MIN_FPS = 2
+MIN_SCALE = 0.25
+MAX_CONSECUTIVE_ERRORS = 10
+
+# Vision uploads: fit 2x1 tiles of 512 px, about 425 tokens at "high" detail
+VISION_MAX_SIZE = (1024, 512)
+KEYFRAME_MIN_CHANGE = 0.02   # share of tiles that must change to be a new keyframe
+KEYFRAME_MIN_INTERVAL = 1.0  # seconds between keyframes
+ENCODE_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+class FramePacer:
+    """Schedule frames on monotonic deadlines, dropping frames instead of drifting"""
+    def __init__(self, fps):
+        self.period = 1 / fps
+        self.next_deadline = None
+        self.dropped_frames = 0
+        self.late_frames = 0
+
+    def set_fps(self, fps):
+        self.period = 1 / fps
+
+    def wait(self):
+        """Sleep until the next frame slot, skipping slots that were already missed"""
+        now = time.monotonic()
+        if self.next_deadline is None:
+            self.next_deadline = now
+            return
+        self.next_deadline += self.period
+        if now > self.next_deadline:
+            self.late_frames += 1
+            missed = int((now - self.next_deadline) / self.period)
+            if missed:
+                self.dropped_frames += missed
+                self.next_deadline += missed * self.period
+        delay = self.next_deadline - now
+        if delay > 0:
+            time.sleep(delay)
+
+# Publish-subscribe distribution of captured frames
+Frame = namedtuple("Frame", ["version", "timestamp", "image"])
+
+class FrameSubscription:
+    """Bounded per-consumer frame queue that drops the oldest frame when full"""
+    def __init__(self, bus, maxsize):
+        self.bus = bus
+        self.frames = deque(maxlen=maxsize)
+        self.cond = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def _push(self, frame):
+        with self.cond:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+            self.frames.append(frame)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Wait for the next Frame; None on timeout or once closed"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.frames or self.closed, timeout):
+                return None
+            return self.frames.popleft() if self.frames else None
+
+    def get_latest(self, timeout=None):
+        """Wait for a Frame and skip straight to the newest one queued"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.frames or self.closed, timeout):
+                return None
+            if not self.frames:
+                return None
+            self.dropped += len(self.frames) - 1
+            frame = self.frames.pop()
+            self.frames.clear()
+            return frame
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class FrameBus:
+    """Fan captured frames out to independent subscribers.
+
+    Every subscriber receives the same read-only array, and a slow subscriber
+    only loses its own oldest frames, never blocking capture or the others.
+    """
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, maxsize=2):
+        subscription = FrameSubscription(self, maxsize)
+        with self.lock:
+            self.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    def has_subscribers(self):
+        return bool(self.subscribers)
+
+    def publish(self, version, timestamp, image):
+        frame = Frame(version, timestamp, image)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription._push(frame)
+
+    def get_stats(self):
+        with self.lock:
+            return [{"queued": len(sub.frames), "dropped": sub.dropped} for sub in self.subscribers]
+
+# Screen capture backends
+class CaptureBackend:
+    """Base class for screen grabbers.
+
+    grab() returns an HxWx3 uint8 array in `color` channel order. The array may
+    be a buffer the backend reuses, so it is only valid until the next grab().
+    """
+    name = None
+    color = "RGB"
+
+    def grab(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class PyAutoGUICapture(CaptureBackend):
+    """Screenshot through pyautogui/PIL, portable but slow"""
+    name = "pyautogui"
+    color = "RGB"
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def grab(self):
+        return np.asarray(self.pyautogui.screenshot())
+
+class MSSCapture(CaptureBackend):
+    """Screenshot through mss (XGetImage/XShm on X11) into a reusable buffer"""
+    name = "mss"
+    color = "BGR"
+
+    def __init__(self, monitor=1):
+        if mss is None:
+            raise RuntimeError("mss is not installed")
+        self.monitor_index = monitor
+        self.sct = None
+        self.monitor = None
+        self.buffer = None
+
+    def grab(self):
+        # mss handles are per thread, so open it lazily in the capture thread
+        if self.sct is None:
+            self.sct = mss.mss()
+            self.monitor = self.sct.monitors[self.monitor_index]
+        shot = self.sct.grab(self.monitor)
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        if self.buffer is None or self.buffer.shape[:2] != bgra.shape[:2]:
+            self.buffer = np.empty((shot.height, shot.width, 3), dtype=np.uint8)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self.buffer)
+        return self.buffer
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
+
+class SyntheticCapture(CaptureBackend):
+    """Generated frames (static gradient plus a moving square) for headless testing"""
+    name = "synthetic"
+    color = "BGR"
+
+    def __init__(self, width=1280, height=720, square=120, speed=8):
+        self.square = square
+        self.speed = speed
+        self.step = 0
+        gradient = np.linspace(0, 255, width, dtype=np.uint8)
+        self.background = np.empty((height, width, 3), dtype=np.uint8)
+        self.background[:] = gradient[None, :, None]
+        self.buffer = self.background.copy()
+        self.last = None
+
+    def grab(self):
+        height, width = self.buffer.shape[:2]
+        if self.last is not None:
+            ys, xs = self.last
+            self.buffer[ys, xs] = self.background[ys, xs]
+        x = (self.step * self.speed) % (width - self.square)
+        y = (self.step * self.speed // 2) % (height - self.square)
+        self.last = (slice(y, y + self.square), slice(x, x + self.square))
+        self.buffer[self.last] = (0, 0, 255)
+        self.step += 1
+        return self.buffer
+
+CAPTURE_BACKENDS = {
+    MSSCapture.name: MSSCapture,
+    PyAutoGUICapture.name: PyAutoGUICapture,
+    SyntheticCapture.name: SyntheticCapture,
+}
+
+def get_capture_backend(name=None):
+    """Create the configured capture backend (SCREEN_CAPTURE_BACKEND env var, auto by default)"""
+    name = (name or os.getenv("SCREEN_CAPTURE_BACKEND") or "auto").lower()
+    if name == "auto":
+        name = MSSCapture.name if mss is not None else PyAutoGUICapture.name
+    if name not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend '{name}', choose from {sorted(CAPTURE_BACKENDS)}")
+    return CAPTURE_BACKENDS[name]()
 
 class ScreenShareManager:
-    def __init__(self, fps=15):
+    """Capture the screen in a background thread and serve the latest BGR frame.
+
+    roi is an optional (x, y, width, height) region of the grabbed screen and
+    target_size an optional (width, height) box the frame is downscaled to fit.
+    """
+    def __init__(self, fps=15, tile_size=TILE_SIZE, backend=None, roi=None, target_size=None):
         self.fps = fps
+        self.tile_size = tile_size
+        self.roi = roi
+        self.target_size = target_size
+        if isinstance(backend, CaptureBackend):
+            self.backend = backend
+        else:
+            self.backend = get_capture_backend(backend)
         self.running = False
         self.thread = None
-        self.frame = None
+        self.version = 0
         self.lock = threading.Lock()
-    
+        self.bus = FrameBus()
+
+        # Double-buffered output: the writer fills the back buffer, readers get
+        # read-only views of the front one
+        self._buffers = None
+        self._views = None
+        self._buffer_versions = [0, 0]
+        self._front = 0
+        blank_size = target_size or (500, 300)
+        self._blank = np.zeros((blank_size[1], blank_size[0], 3), dtype=np.uint8)
+        self._blank.flags.writeable = False
+        # Subscriber snapshots: pooled buffers, reusable once every view of them is released
+        self._snapshots = []
+        self.snapshot_copies = 0
+
+        # Measured loop rate and capture latency
+        self.frames_captured = 0
+        self.measured_fps = 0.0
+        self.capture_ms = 0.0
+        self.work_ms = 0.0
+        self.errors = 0
+        self._last_loop = None
+
+        # Adaptive rate control, current_fps and scale never exceed the request
+        self.current_fps = fps
+        self.scale = 1.0
+        self.pacer = FramePacer(fps)
+        self._scaled = None
+
+        # Dirty-region tracking state
+        self._grid = None
+        self._sampled = None
+        self._small = None
+        self._padded = None
+        self._weights = None
+        self._tile_hashes = None
+        self._tile_versions = None
+
     def start(self):
         self.running = True
         self.thread = threading.Thread(target=self._capture_screen)
         self.thread.start()
-    
+
     def stop(self):
         self.running = False
         if self.thread:
             self.thread.join()
-    
+
     def _capture_screen(self):
+        consecutive_errors = 0
+        try:
+            while self.running:
+                self.pacer.wait()
+                try:
+                    # Capture screen
+                    captured_at = time.monotonic()
+                    started = time.perf_counter()
+                    image = self.backend.grab()
+                    grabbed = time.perf_counter()
+                    self._record_timing(started, grabbed)
+                    image = self._prepare(image)
+
+                    # Only publish when some tile changed since the last frame
+                    dirty = self._find_dirty_tiles(image)
+                    if dirty.any():
+                        self._publish(image, dirty, captured_at)
+
+                    self._adapt(grabbed - started, time.perf_counter() - started)
+                    consecutive_errors = 0
+                except Exception as e:
+                    self.errors += 1
+                    consecutive_errors += 1
+                    print(f"Screen capture error: {e}")
+                    if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                        print("Screen capture stopped after repeated errors")
+                        self.running = False
+        finally:
+            self.backend.close()
+
+    def _prepare(self, image):
+        """Crop to the ROI and downscale into a reused buffer"""
+        if self.roi is not None:
+            x, y, width, height = self.roi
+            image = image[y:y + height, x:x + width]
+        height, width = image.shape[:2]
+        factor = self.scale
+        if self.target_size is not None:
+            factor *= min(1.0, self.target_size[0] / width, self.target_size[1] / height)
+        if factor >= 1.0:
+            return image
+        size = (max(1, int(width * factor)), max(1, int(height * factor)))
+        if self._scaled is None or self._scaled.shape[1::-1] != size:
+            self._scaled = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        cv2.resize(image, size, dst=self._scaled, interpolation=cv2.INTER_AREA)
+        return self._scaled
+
+    def _adapt(self, grab_time, work_time):
+        """Trade fps and resolution for staying inside the frame budget"""
+        self.work_ms += STATS_SMOOTHING * (work_time * 1000 - self.work_ms)
+        if self.frames_captured % ADAPT_INTERVAL:
+            return
+        work = self.work_ms / 1000
+        if work > WORK_BUDGET / self.current_fps:
+            # Processing dominates: shrink the frame; grabbing dominates: slow down
+            if work - grab_time > grab_time and self.scale > MIN_SCALE:
+                self.scale = max(MIN_SCALE, self.scale * ADAPT_FACTOR)
+            elif self.current_fps > MIN_FPS:
+                self._set_fps(max(MIN_FPS, self.current_fps * ADAPT_FACTOR))
+            elif self.scale > MIN_SCALE:
+                self.scale = max(MIN_SCALE, self.scale * ADAPT_FACTOR)
+        elif self.current_fps < self.fps:
+            faster = min(self.fps, self.current_fps / ADAPT_FACTOR)
+            if work < RECOVER_BUDGET / faster:
+                self._set_fps(faster)
+        elif self.scale < 1.0 and work < RECOVER_BUDGET / self.current_fps:
+            self.scale = min(1.0, self.scale / ADAPT_FACTOR)
+
+    def _set_fps(self, fps):
+        self.current_fps = fps
+        self.pacer.set_fps(fps)
+
+    def _record_timing(self, started, finished):
+        """Update the moving averages of capture latency and loop rate"""
+        capture_ms = (finished - started) * 1000
+        if self._last_loop is None:
+            self.capture_ms = capture_ms
+        else:
+            self.capture_ms += STATS_SMOOTHING * (capture_ms - self.capture_ms)
+            interval = started - self._last_loop
+            if interval > 0:
+                fps = 1 / interval
+                if self.measured_fps:
+                    self.measured_fps += STATS_SMOOTHING * (fps - self.measured_fps)
+                else:
+                    self.measured_fps = fps
+        self._last_loop = started
+        self.frames_captured += 1
+
+    def get_stats(self):
+        """Measured capture rate and per-frame grab latency"""
+        return {
+            "backend": self.backend.name,
+            "target_fps": self.fps,
+            "measured_fps": round(self.measured_fps, 1),
+            "capture_ms": round(self.capture_ms, 1),
+            "frames_captured": self.frames_captured,
+            "version": self.version,
+            "current_fps": round(self.current_fps, 1),
+            "scale": round(self.scale, 2),
+            "work_ms": round(self.work_ms, 1),
+            "dropped_frames": self.pacer.dropped_frames,
+            "late_frames": self.pacer.late_frames,
+            "errors": self.errors,
+            "snapshot_copies": self.snapshot_copies,
+        }
+
+    def _find_dirty_tiles(self, image):
+        """Fingerprint downsampled tiles and return a (rows, cols) mask of changed ones"""
+        step = HASH_STEP
+        side = self.tile_size // step
+        height, width = image.shape[:2]
+        grid = (-(-height // self.tile_size), -(-width // self.tile_size))
+
+        small_size = (-(-width // step), -(-height // step))
+        if grid != self._grid or self._small is None or self._small.shape[1::-1] != small_size:
+            self._grid = grid
+            self._sampled = np.zeros((grid[0] * side, grid[1] * side, 3), dtype=np.uint8)
+            self._small = np.empty((small_size[1], small_size[0], 3), dtype=np.uint8)
+            self._padded = None
+            if (height % step, width % step) != (0, 0):
+                self._padded = np.zeros((small_size[1] * step, small_size[0] * step, 3), dtype=np.uint8)
+            self._weights = np.random.default_rng(0).random(side * side * 3)
+            self._tile_hashes = None
+
+        # Area averaging, so a change to any single pixel moves its tile's fingerprint
+        if self._padded is not None:
+            self._padded[:height, :width] = image
+            image = self._padded
+        cv2.resize(image, small_size, dst=self._small, interpolation=cv2.INTER_AREA)
+        self._sampled[:small_size[1], :small_size[0]] = self._small
+        tiles = self._sampled.reshape(grid[0], side, grid[1], side, 3).transpose(0, 2, 1, 3, 4)
+        hashes = tiles.reshape(grid[0], grid[1], -1) @ self._weights
+
+        if self._tile_hashes is None:
+            dirty = np.ones(grid, dtype=bool)
+        else:
+            dirty = hashes != self._tile_hashes
+        self._tile_hashes = hashes
+        return dirty
+
+    def _publish(self, image, dirty, timestamp):
+        """Bring the back buffer up to date, swap it to the front and notify subscribers"""
+        is_rgb = self.backend.color == "RGB"
+
+        if self._buffers is None or self._buffers[0].shape != image.shape:
+            with self.lock:
+                self._buffers = [np.empty_like(image), np.empty_like(image)]
+                self._views = [buffer.view() for buffer in self._buffers]
+                for view in self._views:
+                    view.flags.writeable = False
+                self._buffer_versions = [0, 0]
+                self._tile_versions = np.zeros(dirty.shape, dtype=np.int64)
+                self._snapshots = []
+                dirty[:] = True
+
+        # The back buffer is one publish behind, so refresh everything that
+        # changed since it was last written, not only this frame's tiles
+        back = 1 - self._front
+        buffer = self._buffers[back]
+        stale = dirty | (self._tile_versions > self._buffer_versions[back])
+        self._copy_tiles(buffer, image, stale, is_rgb)
+
+        with self.lock:
+            self.version += 1
+            self._tile_versions[dirty] = self.version
+            self._buffer_versions[back] = self.version
+            self._front = back
+
+        # Subscribers may hold frames indefinitely, so they get one frozen
+        # snapshot shared by all of them instead of the recycled buffers
+        if self.bus.has_subscribers():
+            self.bus.publish(self.version, timestamp, self._snapshot(buffer))
+
+    def _copy_tiles(self, dst, src, stale, is_rgb=False):
+        """Copy the stale tiles of src into dst, or the whole frame when most are stale"""
+        size = self.tile_size
+        if stale.mean() > FULL_UPDATE_RATIO:
+            if is_rgb:
+                cv2.cvtColor(src, cv2.COLOR_RGB2BGR, dst=dst)
+            else:
+                np.copyto(dst, src)
+            return
+        for row, col in zip(*np.nonzero(stale)):
+            ys = slice(row * size, (row + 1) * size)
+            xs = slice(col * size, (col + 1) * size)
+            dst[ys, xs] = src[ys, xs, ::-1] if is_rgb else src[ys, xs]
+
+    def _snapshot(self, front):
+        """Read-only frame for subscribers that only costs a copy of the tiles changed since its buffer was last used"""
+        # Views subscribers derive (crops, np.asarray) all reference the buffer
+        # itself, so it is free only when the pool holds the last reference:
+        # the entry's plus getrefcount's own argument
+        entry = next((e for e in self._snapshots if sys.getrefcount(e["buffer"]) <= 2), None)
+        if entry is None:
+            if len(self._snapshots) >= SNAPSHOT_POOL_SIZE:
+                # Every pooled buffer is still held, e.g. by a backed-up subscriber
+                self.snapshot_copies += 1
+                snapshot = front.copy()
+                snapshot.flags.writeable = False
+                return snapshot
+            entry = {"buffer": np.empty_like(front), "version": 0}
+            self._snapshots.append(entry)
+        self._copy_tiles(entry["buffer"], front, self._tile_versions > entry["version"])
+        entry["version"] = self.version
+        view = entry["buffer"].view()
+        view.flags.writeable = False
+        return view
+
+    def get_frame_version(self):
+        """Version counter, increases only when the screen content changed"""
+        with self.lock:
+            return self.version
+
+    def get_change_ratio(self, since_version=0):
+        """Share of tiles that changed after since_version"""
+        with self.lock:
+            if self._tile_versions is None:
+                return 0.0
+            return float((self._tile_versions > since_version).mean())
+
+    def get_delta(self, since_version=0):
+        """Return (version, tiles) with the tiles changed after since_version.
+
+        tiles is a list of (x, y, tile) where tile is a BGR copy; consumers keep
+        the returned version and pass it back on the next call.
+        """
+        size = self.tile_size
+        with self.lock:
+            if self._buffers is None or since_version >= self.version:
+                return self.version, []
+            frame = self._buffers[self._front]
+            tiles = []
+            for row, col in zip(*np.nonzero(self._tile_versions > since_version)):
+                y, x = row * size, col * size
+                tiles.append((x, y, frame[y:y + size, x:x + size].copy()))
+            return self.version, tiles
+
+    def get_frame(self):
+        """Return the latest frame as a read-only view without copying.
+
+        The view stays valid until the next frame is published, copy it to keep it.
+        """
+        with self.lock:
+            return self._views[self._front] if self._views is not None else self._blank
+
+# Keyframe encoding for vision-model uploads
+class FrameEncoder:
+    """Pick changed screen frames as keyframes and encode them for upload in a worker thread"""
+    def __init__(self, manager, fmt="jpeg", quality=70, max_size=VISION_MAX_SIZE,
+                 min_change=KEYFRAME_MIN_CHANGE, min_interval=KEYFRAME_MIN_INTERVAL):
+        if fmt not in ENCODE_FORMATS:
+            raise ValueError(f"Unknown image format '{fmt}', choose from {sorted(ENCODE_FORMATS)}")
+        self.manager = manager
+        self.fmt = fmt
+        self.quality = quality
+        self.max_size = max_size
+        self.min_change = min_change
+        self.min_interval = min_interval
+        self.subscription = None
+        self.running = False
+        self.thread = None
+        self.lock = threading.Lock()
+        self.keyframe = None
+        self.keyframes_encoded = 0
+        self.encode_ms = 0.0
+        self._version = 0
+        self._last_keyframe = 0.0
+        self._resized = None
+
+    def start(self):
+        self.running = True
+        self.subscription = self.manager.bus.subscribe(maxsize=1)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.subscription:
+            self.subscription.close()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        # Latest frame not yet encoded: a change inside min_interval is held
+        # and encoded once the interval has passed, even if the screen stays static
+        pending = None
         while self.running:
+            wait = self._last_keyframe + self.min_interval - time.monotonic()
+            frame = self.subscription.get_latest(timeout=min(0.5, wait) if pending and wait > 0 else 0.5)
+            if frame is not None:
+                pending = frame
+            if pending is None:
+                continue
             try:
-                # Capture screen
-                img = pyautogui.screenshot()
-                frame = np.array(img)
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                
-                with self.lock:
-                    self.frame = frame
-                
-                time.sleep(1 / self.fps)
+                if (time.monotonic() - self._last_keyframe >= self.min_interval and
+                        self.manager.get_change_ratio(self._version) >= self.min_change):
+                    self._encode(pending.image, pending.version)
+                    pending = None
             except Exception as e:
-                print(f"Screen capture error: {e}")
-                break
-    
-    def get_frame(self):
+                pending = None
+                print(f"Frame encoding error: {e}")
+
+    def _encode(self, frame, version):
+        started = time.perf_counter()
+        height, width = frame.shape[:2]
+        factor = min(1.0, self.max_size[0] / width, self.max_size[1] / height)
+        if factor < 1.0:
+            size = (max(1, int(width * factor)), max(1, int(height * factor)))
+            if self._resized is None or self._resized.shape[1::-1] != size:
+                self._resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            frame = cv2.resize(frame, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+
+        extension, mime, quality_flag = ENCODE_FORMATS[self.fmt]
+        ok, encoded = cv2.imencode(extension, frame, [quality_flag, self.quality])
+        if not ok:
+            raise RuntimeError(f"{self.fmt} encoding failed")
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.keyframe = {
+                "data": encoded.tobytes(),
+                "mime": mime,
+                "version": version,
+                "timestamp": time.time(),
+            }
+            self.keyframes_encoded += 1
+            self.encode_ms += STATS_SMOOTHING * (elapsed_ms - self.encode_ms)
+        self._version = version
+        self._last_keyframe = time.monotonic()
+
+    def latest_keyframe(self):
+        """Most recent encoded keyframe as a dict (data, mime, version, timestamp) or None"""
+        with self.lock:
+            return self.keyframe
+
+    def image_content(self, detail="high"):
+        """Latest keyframe as an OpenAI chat image content part, or None"""
+        keyframe = self.latest_keyframe()
+        if keyframe is None:
+            return None
+        return self._content(keyframe, detail)
+
+    def new_image_content(self, since_version=0, detail="high"):
+        """(version, content part) of the latest keyframe if it is newer than since_version, else None"""
+        keyframe = self.latest_keyframe()
+        if keyframe is None or keyframe["version"] <= since_version:
+            return None
+        return keyframe["version"], self._content(keyframe, detail)
+
+    @staticmethod
+    def _content(keyframe, detail):
+        encoded = base64.b64encode(keyframe["data"]).decode("ascii")
+        return {
+            "type": "image_url",
+            "image_url": {"url": f"data:{keyframe['mime']};base64,{encoded}", "detail": detail},
+        }
+
+    def get_stats(self):
         with self.lock:
-            return self.frame if self.frame is not None else np.zeros((300, 500, 3), dtype=np.uint8)
\ No newline at end of file
+            return {
+                "keyframes_encoded": self.keyframes_encoded,
+                "encode_ms": round(self.encode_ms, 1),
+                "bytes": len(self.keyframe["data"]) if self.keyframe else 0,
+            }
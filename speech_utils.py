@@ -1,34 +1,454 @@
 import sounddevice as sd
 import soundfile as sf
+import threading
 import queue
 import json
+import time
+import io
 import os
 import numpy as np
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from vosk import Model, KaldiRecognizer
 
+BLOCK_DURATION = 0.1      # seconds of audio per callback block
+MAX_QUEUE_BLOCKS = 300    # 30 s of audio, about 1.9 MB of float32 mono at 16 kHz
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+LEVEL_HISTORY = 64        # blocks of level measurements kept for the meter
+LEVEL_WINDOW_BLOCKS = 3   # blocks averaged into one meter reading
+CLIP_LEVEL = 0.99         # float samples at or beyond this count as clipped
+TRANSCRIBE_CHUNK_SECONDS = 0.5  # audio fed to the recognizer per call when transcribing whole recordings
+RECOGNIZER_POOL_SIZE = 4        # idle recognizers kept per model and sample rate
+# Directory of Vosk models, by default the one bundled with the app
+MODELS_DIR = os.getenv("VOSK_MODELS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vosk-model-small-en-us-0.15"))
+MODEL_MEMORY_BYTES = int(os.getenv("VOSK_MODEL_MEMORY_MB", "4096")) * 1024 * 1024
+# Optional larger model (registry name or directory) that re-transcribes finished utterances
+LARGE_MODEL_PATH = os.getenv("VOSK_LARGE_MODEL_PATH")
+RESCORE_WORKERS = 2
+
+# Endpointing for single-answer recordings
+SPEECH_THRESHOLD = 0.02   # block RMS that counts as speech
+TRAILING_SILENCE = 1.0    # seconds of silence that end the answer
+START_TIMEOUT = 10        # seconds to wait for the speaker to begin
+MAX_ANSWER_SECONDS = 120
+PREROLL_BLOCKS = 3        # blocks kept from before speech so the first word is not clipped
+
+# Vosk model registry
+class ModelRegistry:
+    """Vosk models found under a directory, loaded on first use.
+
+    Any folder holding conf/model.conf is a model, named after the folder.
+    Loaded models are kept in LRU order and the least recently used are
+    dropped once their combined on-disk size, a fair proxy for resident
+    memory, exceeds memory_budget. Models with checked-out recognizers are
+    never dropped, so the budget may be exceeded while they are busy.
+    """
+    def __init__(self, models_dir=MODELS_DIR, memory_budget=MODEL_MEMORY_BYTES, default=None):
+        self.models_dir = models_dir
+        self.memory_budget = memory_budget
+        self.paths = self._discover(models_dir)
+        self.default = default or os.getenv("VOSK_MODEL") or next(iter(sorted(self.paths)), None)
+        self.loaded = OrderedDict()
+        self.load_times = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self._loading = {}
+    
+    @staticmethod
+    def _discover(models_dir):
+        paths = {}
+        for root, dirs, _ in os.walk(models_dir):
+            if os.path.isfile(os.path.join(root, "conf", "model.conf")):
+                paths[os.path.basename(os.path.normpath(root))] = root
+                dirs.clear()
+        return paths
+    
+    @staticmethod
+    def _disk_size(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    
+    def names(self):
+        return sorted(self.paths)
+    
+    def _resolve(self, name):
+        """Registered name, or a model directory used directly"""
+        name = name or self.default
+        if name in self.paths:
+            return name, self.paths[name]
+        if name and os.path.isfile(os.path.join(name, "conf", "model.conf")):
+            return os.path.abspath(name), name
+        raise KeyError(f"Unknown Vosk model '{name}' in {self.models_dir}, available: {self.names()}")
+    
+    def get(self, name=None):
+        """Return a loaded model, loading it (once, even with concurrent callers) if needed"""
+        name, path = self._resolve(name)
+        with self.lock:
+            if name in self.loaded:
+                self.loaded.move_to_end(name)
+                return self.loaded[name][0]
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:
+            with self.lock:
+                if name in self.loaded:
+                    self.loaded.move_to_end(name)
+                    return self.loaded[name][0]
+            start = time.perf_counter()
+            model = Model(path)
+            size = self._disk_size(path)
+            with self.lock:
+                self.load_times[name] = time.perf_counter() - start
+                self.loaded[name] = (model, size)
+                self._evict()
+            return model
+    
+    def _evict(self):
+        """Drop least recently used models that no recognizer is decoding with"""
+        newest = next(reversed(self.loaded))
+        for name in list(self.loaded):
+            if sum(size for _, size in self.loaded.values()) <= self.memory_budget:
+                return
+            model = self.loaded[name][0]
+            # Evicting a busy model would not free it and the next get() would load a second copy
+            if name == newest or _model_in_use(model):
+                continue
+            del self.loaded[name]
+            _drop_pools(model)
+            self.evictions += 1
+    
+    def preload(self, names=None):
+        """Load models ahead of the first request (VOSK_PRELOAD, comma separated, by default)"""
+        if names is None:
+            names = [n.strip() for n in os.getenv("VOSK_PRELOAD", "").split(",") if n.strip()]
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Error preloading Vosk model '{name}': {e}")
+    
+    def get_stats(self):
+        with self.lock:
+            return {
+                "available": self.names(),
+                "default": self.default,
+                "loaded": list(self.loaded),
+                "resident_bytes": sum(size for _, size in self.loaded.values()),
+                "memory_budget": self.memory_budget,
+                "load_seconds": {name: round(t, 3) for name, t in self.load_times.items()},
+                "evictions": self.evictions,
+            }
+
+model_registry = ModelRegistry()
+
+def get_model(name=None):
+    """A Vosk model by registry name or directory (the default model if None)"""
+    return model_registry.get(name)
+
+# Recognizer reuse
+class RecognizerPool:
+    """Idle KaldiRecognizers for one model, sample rate and optional grammar.
+
+    Resetting a recognizer is much cheaper than building one. Recognizers are
+    Reset() when checked in, so no state carries over between jobs, and at
+    most max_size idle ones are kept. in_use counts checked-out recognizers,
+    which keeps the model registry from evicting a model that is decoding.
+    """
+    def __init__(self, model, samplerate, max_size=RECOGNIZER_POOL_SIZE, grammar=None):
+        self.model = model
+        self.samplerate = samplerate
+        self.max_size = max_size
+        self.grammar = grammar
+        self.idle = []
+        self.in_use = 0
+        self.created = 0
+        self.reused = 0
+        self.lock = threading.Lock()
+    
+    def checkout(self):
+        with self.lock:
+            self.in_use += 1
+            if self.idle:
+                self.reused += 1
+                return self.idle.pop()
+            self.created += 1
+        try:
+            if self.grammar:
+                return KaldiRecognizer(self.model, self.samplerate, self.grammar)
+            return KaldiRecognizer(self.model, self.samplerate)
+        except Exception:
+            with self.lock:
+                self.in_use -= 1
+            raise
+    
+    def checkin(self, recognizer):
+        recognizer.Reset()
+        with self.lock:
+            self.in_use -= 1
+            if len(self.idle) < self.max_size:
+                self.idle.append(recognizer)
+    
+    @contextmanager
+    def recognizer(self):
+        """Check out a recognizer for the duration of a with block"""
+        recognizer = self.checkout()
+        try:
+            yield recognizer
+        finally:
+            self.checkin(recognizer)
+    
+    def get_stats(self):
+        with self.lock:
+            return {"idle": len(self.idle), "in_use": self.in_use, "created": self.created, "reused": self.reused}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_recognizer_pool(model=None, samplerate=16000, grammar=None):
+    """Shared recognizer pool for a model (the default model if None), sample rate and grammar"""
+    model = model or get_model()
+    key = (model, samplerate, grammar)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = RecognizerPool(model, samplerate, grammar=grammar)
+        return _pools[key]
+
+def _model_in_use(model):
+    """Whether any recognizer of the model is checked out"""
+    with _pools_lock:
+        return any(pool.in_use for key, pool in _pools.items() if key[0] is model)
+
+def _drop_pools(model):
+    """Forget the recognizer pools of an evicted model"""
+    with _pools_lock:
+        for key in [key for key in _pools if key[0] is model]:
+            del _pools[key]
+
+# Spoken commands
+COMMANDS = {"next question": "next", "repeat": "repeat", "end session": "end"}
+
+class CommandSpotter:
+    """Detect a few spoken commands with a grammar-restricted recognizer.
+
+    Decoding against a handful of phrases is far cheaper than open
+    vocabulary recognition. Anything else decodes to [unk], and a command only
+    fires when it is the whole utterance.
+    """
+    def __init__(self, model=None, samplerate=16000, commands=COMMANDS):
+        self.commands = commands
+        grammar = json.dumps(list(commands) + ["[unk]"])
+        self.pool = get_recognizer_pool(model, samplerate, grammar)
+        self.recognizer = self.pool.checkout()
+    
+    def close(self):
+        """Return the recognizer to its pool"""
+        if self.recognizer is not None:
+            self.pool.checkin(self.recognizer)
+            self.recognizer = None
+    
+    def feed(self, pcm):
+        """Feed int16 audio, return the command it completed or None"""
+        if self.recognizer.AcceptWaveform(pcm.tobytes()):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            return self.commands.get(text)
+        return None
+    
+    def is_command(self, transcript):
+        """Whether a full transcript is just a command phrase"""
+        return " ".join(transcript.lower().split()) in self.commands
+
+# Noise suppression and gain control ahead of recognition
+PREPROCESS_FRAME = 512     # STFT frame, 32 ms at 16 kHz, with 50% overlap
+HIGHPASS_HZ = 100          # removes hum and desk rumble below the voice band
+NOISE_RISE = 0.02          # per-block rate at which the noise estimate may grow
+SPECTRAL_FLOOR = 0.1       # lowest gain per bin, avoids "musical noise"
+AGC_TARGET_RMS = 0.1
+AGC_MAX_GAIN = 10.0
+AGC_SPEECH_RMS = 0.005     # frames quieter than this do not move the gain
+AGC_SMOOTHING = 0.2
+
+class AudioPreprocessor:
+    """High-pass filter, spectral-subtraction noise suppression and AGC.
+
+    Audio is processed in 50% overlapping sqrt-Hann STFT frames; all complete
+    frames in a block are transformed in one batched FFT. The noise spectrum
+    tracks the per-block minimum, dropping at once and rising slowly. Input
+    and window buffers are allocated once. Output lags input by one frame and
+    its length follows the hop size, not the input block size.
+    """
+    def __init__(self, samplerate=16000, frame_size=PREPROCESS_FRAME, highpass_hz=HIGHPASS_HZ,
+                 floor=SPECTRAL_FLOOR, target_rms=AGC_TARGET_RMS, max_gain=AGC_MAX_GAIN):
+        self.frame_size = frame_size
+        self.hop = frame_size // 2
+        self.floor = floor
+        self.target_rms = target_rms
+        self.max_gain = max_gain
+        # sqrt of a periodic Hann window: analysis x synthesis sums to one at 50% overlap
+        self.window = np.sin(np.pi * np.arange(frame_size) / frame_size).astype(np.float32)
+        freqs = np.fft.rfftfreq(frame_size, 1 / samplerate)
+        self.highpass = np.clip((freqs - highpass_hz / 2) / (highpass_hz / 2), 0.0, 1.0).astype(np.float32)
+        self.noise = None
+        self.gain = 1.0
+        self._input = np.zeros(frame_size + int(samplerate * BLOCK_DURATION) * 2, dtype=np.float32)
+        self._filled = self.hop  # start with half a frame of silence so the first samples are not faded
+        self._tail = np.zeros(self.hop, dtype=np.float32)
+    
+    def reset(self):
+        self.noise = None
+        self.gain = 1.0
+        self._input[:] = 0
+        self._filled = self.hop
+        self._tail[:] = 0
+    
+    def process(self, block):
+        """Clean a float block in [-1, 1], return the processed samples available so far"""
+        if block.ndim > 1:
+            block = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+        end = self._filled + len(block)
+        if end > len(self._input):
+            self._input = np.concatenate([self._input, np.zeros(end - len(self._input), dtype=np.float32)])
+        self._input[self._filled:end] = block
+        self._filled = end
+        count = (end - self.frame_size) // self.hop + 1 if end >= self.frame_size else 0
+        if count == 0:
+            return np.zeros(0, dtype=np.float32)
+        
+        frames = np.lib.stride_tricks.as_strided(
+            self._input, shape=(count, self.frame_size),
+            strides=(self._input.strides[0] * self.hop, self._input.strides[0])
+        )
+        spectrum = np.fft.rfft(frames * self.window, axis=1)
+        magnitude = np.abs(spectrum)
+        self._update_noise(magnitude)
+        gain = np.maximum(1.0 - self.noise / (magnitude + 1e-9), self.floor) * self.highpass
+        frames_out = np.fft.irfft(spectrum * gain, n=self.frame_size, axis=1).astype(np.float32) * self.window
+        
+        # Overlap-add: each output hop is the second half of one frame plus the first half of the next
+        out = frames_out[:, :self.hop].copy()
+        out[0] += self._tail
+        out[1:] += frames_out[:-1, self.hop:]
+        self._tail[:] = frames_out[-1, self.hop:]
+        
+        consumed = count * self.hop
+        self._input[:end - consumed] = self._input[consumed:end]
+        self._filled = end - consumed
+        return self._agc(out.reshape(-1))
+    
+    def _update_noise(self, magnitude):
+        if np.max(magnitude) < 1e-6:
+            return  # digital silence, e.g. gated input, says nothing about the room
+        floor = magnitude.min(axis=0)
+        if self.noise is None:
+            self.noise = floor
+        else:
+            self.noise = np.where(floor < self.noise, floor, self.noise + NOISE_RISE * (floor - self.noise))
+    
+    def _agc(self, out):
+        rms = np.sqrt(np.mean(np.square(out)))
+        if rms > AGC_SPEECH_RMS:
+            desired = min(self.target_rms / rms, self.max_gain)
+            self.gain += AGC_SMOOTHING * (desired - self.gain)
+        np.multiply(out, self.gain, out=out)
+        return np.clip(out, -1.0, 1.0, out=out)
+
 # Audio recorder class for continuous recording
 class AudioRecorder:
-    def __init__(self, samplerate=16000, channels=1):
+    def __init__(self, samplerate=16000, channels=1, max_queue_blocks=MAX_QUEUE_BLOCKS, overflow="drop_oldest",
+                 model=None, buffered=True):
+        """buffered keeps blocks in q for drain()/get_audio(); turn it off when
+        every consumer is a listener, so nothing fills up unread."""
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
         self.samplerate = samplerate
         self.channels = channels
+        self.blocksize = int(samplerate * BLOCK_DURATION)
         self.recording = None
         self.stream = None
-        self.q = queue.Queue()
+        self.overflow = overflow
+        self.buffered = buffered
+        self.q = queue.Queue(maxsize=max_queue_blocks)
+        self.dropped_blocks = 0
+        self.max_depth = 0
+        self.listeners = []
+        
+        # Level meter: rms, peak and clip ratio per block, written only by the audio thread
+        self._levels = np.zeros((LEVEL_HISTORY, 3), dtype=np.float32)
+        self._level_count = 0
+        self._last_block = None
         
-        # Initialize Vosk model
-        model_path = r"D:\Smart IT _ support chatbot\vosk-model-small-en-us-0.15\vosk-model-small-en-us-0.15"
-        self.model = Model(model_path)
-        self.recognizer = KaldiRecognizer(self.model, samplerate)
+        # Vosk model by registry name or an already loaded Model, the default model if None
+        self.model = model if isinstance(model, Model) else get_model(model)
     
-    def callback(self, indata, frames, time, status):
+    def callback(self, indata, frames, time_info, status):
         """Callback function for audio stream"""
-        self.q.put(indata.copy())
+        block = indata.copy()
+        if self.buffered:
+            self._enqueue(block)
+        timestamp = time.monotonic()
+        self._measure(block, timestamp)
+        for listener in self.listeners:
+            listener(block, timestamp)
+    
+    def _enqueue(self, block):
+        """Queue a block without ever blocking the audio thread"""
+        try:
+            self.q.put_nowait(block)
+        except queue.Full:
+            self.dropped_blocks += 1
+            if self.overflow == "drop_oldest":
+                try:
+                    self.q.get_nowait()
+                    self.q.put_nowait(block)
+                except (queue.Empty, queue.Full):
+                    pass
+        self.max_depth = max(self.max_depth, self.q.qsize())
+    
+    def _measure(self, block, timestamp):
+        samples = block.reshape(-1)
+        if not len(samples):
+            return
+        rms = np.sqrt(np.dot(samples, samples) / len(samples))
+        peak = max(samples.max(), -samples.min())
+        clipped = np.count_nonzero(samples >= CLIP_LEVEL) + np.count_nonzero(samples <= -CLIP_LEVEL)
+        self._levels[self._level_count % LEVEL_HISTORY] = (rms, peak, clipped / len(samples))
+        self._last_block = timestamp
+        # Publish the row only after it is written, readers never take a lock
+        self._level_count += 1
+    
+    def get_levels(self, blocks=LEVEL_WINDOW_BLOCKS):
+        """Recent input level for a meter (None before any audio), cheap enough to poll at 10 Hz"""
+        count = self._level_count
+        blocks = min(blocks, count, LEVEL_HISTORY - 1)
+        if blocks == 0:
+            return None
+        recent = self._levels[np.arange(count - blocks, count) % LEVEL_HISTORY]
+        rms = float(np.sqrt(np.mean(np.square(recent[:, 0]))))
+        peak = float(recent[:, 1].max())
+        return {
+            "rms": rms,
+            "peak": peak,
+            "rms_dbfs": float(20 * np.log10(max(rms, 1e-5))),
+            "peak_dbfs": float(20 * np.log10(max(peak, 1e-5))),
+            "clip_ratio": float(recent[:, 2].mean()),
+            "age": time.monotonic() - self._last_block,
+        }
+    
+    def add_listener(self, listener):
+        """Call listener(block, timestamp) for every captured block.
+
+        Listeners run on the audio thread and must return immediately;
+        timestamp is time.monotonic() when the block arrived.
+        """
+        self.listeners = self.listeners + [listener]
+    
+    def remove_listener(self, listener):
+        self.listeners = [l for l in self.listeners if l is not listener]
     
     def start(self):
         """Start audio recording"""
         self.stream = sd.InputStream(
             samplerate=self.samplerate,
             channels=self.channels,
+            blocksize=self.blocksize,
             callback=self.callback,
             dtype='float32'
         )
@@ -41,22 +461,290 @@ class AudioRecorder:
             self.stream.close()
             self.stream = None
     
+    def drain(self, max_blocks=None):
+        """Remove queued blocks and return them as one array (None if empty)"""
+        blocks = []
+        while max_blocks is None or len(blocks) < max_blocks:
+            try:
+                blocks.append(self.q.get_nowait())
+            except queue.Empty:
+                break
+        return np.concatenate(blocks) if blocks else None
+    
     def get_audio(self):
-        """Get accumulated audio data"""
-        if not self.q.empty():
-            return np.concatenate(list(self.q.queue))
-        return None
+        """Get accumulated audio data, consuming it from the queue"""
+        return self.drain()
+    
+    def get_metrics(self):
+        """Queue depth and overflow counters"""
+        return {
+            "queue_depth": self.q.qsize(),
+            "max_depth": self.max_depth,
+            "capacity": self.q.maxsize,
+            "dropped_blocks": self.dropped_blocks,
+            "overflow": self.overflow,
+            "buffered": self.buffered,
+        }
+
+def _to_pcm16(block):
+    """Mono 16-bit PCM for Vosk from float [-1, 1] or int16 samples"""
+    if block.ndim > 1:
+        # Average in the input's own scale so int16 stays int16
+        block = block.mean(axis=1).astype(block.dtype) if block.shape[1] > 1 else block[:, 0]
+    if block.dtype != np.int16:
+        block = (np.clip(block, -1.0, 1.0) * 32767).astype(np.int16)
+    return block
+
+def _array_chunks(data, chunk_frames):
+    for start in range(0, len(data), chunk_frames):
+        yield _to_pcm16(data[start:start + chunk_frames])
+
+def _file_chunks(file, chunk_frames):
+    """Read an audio file block by block so memory does not grow with its length"""
+    with sf.SoundFile(file) as f:
+        yield f.samplerate
+        for block in f.blocks(blocksize=chunk_frames, dtype='int16', always_2d=True):
+            yield _to_pcm16(block)
+
+def transcribe_audio(source, samplerate=16000, chunk_seconds=TRANSCRIBE_CHUNK_SECONDS, model=None):
+    """Transcribe a recorder, NumPy array, bytes or audio file path.
+
+    Arrays hold float samples in [-1, 1] or int16. Bytes are raw 16-bit mono
+    PCM at samplerate, or a complete WAV file if they start with a RIFF header.
+    Files are read in blocks, so memory stays constant for long recordings.
+    model defaults to the recorder's model for a recorder and to the small
+    real-time model otherwise. Returns the transcript, or
+    None when there is no audio.
+    """
+    chunk_frames = int(samplerate * chunk_seconds)
+    if isinstance(source, AudioRecorder):
+        samplerate = source.samplerate
+        model = model or source.model
+        source = source.get_audio()
+        if source is None:
+            return None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = bytes(source)
+        if source.startswith(b"RIFF"):
+            source = io.BytesIO(source)
+        else:
+            source = np.frombuffer(source, dtype=np.int16)
+    
+    if isinstance(source, np.ndarray):
+        if source.size == 0:
+            return None
+        chunks = _array_chunks(source, chunk_frames)
+    elif isinstance(source, (str, os.PathLike, io.IOBase)):
+        chunks = _file_chunks(source, chunk_frames)
+        samplerate = next(chunks)
+    else:
+        raise TypeError(f"Cannot transcribe {type(source).__name__}")
+    
+    texts = []
+    with get_recognizer_pool(model, samplerate).recognizer() as recognizer:
+        for chunk in chunks:
+            if recognizer.AcceptWaveform(chunk.tobytes()):
+                texts.append(json.loads(recognizer.Result()).get("text", ""))
+        texts.append(json.loads(recognizer.FinalResult()).get("text", ""))
+    return " ".join(t for t in texts if t)
+
+# Second-pass recognition
+class Rescorer:
+    """Re-transcribe finished utterances with a larger model in the background.
+
+    The small model keeps the interaction fast; this pass replaces its
+    transcripts once the slower, more accurate result is ready. The large
+    model is loaded by the first job. callback(key, text, lag) is called in
+    submission order, lag being seconds from submit to delivery.
+    """
+    def __init__(self, callback, model_path=None, samplerate=16000, max_workers=RESCORE_WORKERS):
+        self.callback = callback
+        self.model_path = model_path or LARGE_MODEL_PATH
+        if not self.model_path:
+            raise ValueError("No large model configured, set VOSK_LARGE_MODEL_PATH")
+        self.samplerate = samplerate
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.lags = deque(maxlen=50)
+    
+    def submit(self, key, audio):
+        """Queue int16 or float audio of one utterance for rescoring"""
+        future = self.executor.submit(self._transcribe, audio)
+        with self.lock:
+            self.pending.append((key, time.monotonic(), future))
+        future.add_done_callback(lambda _: self._deliver())
+    
+    def _transcribe(self, audio):
+        return transcribe_audio(audio, self.samplerate, model=get_model(self.model_path))
+    
+    def _deliver(self):
+        """Hand out finished results, holding back any that overtook an earlier job"""
+        with self.lock:
+            while self.pending and self.pending[0][2].done():
+                key, submitted, future = self.pending.popleft()
+                if future.cancelled():
+                    continue
+                lag = time.monotonic() - submitted
+                self.lags.append(lag)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Rescoring error: {e}")
+                    continue
+                self.completed += 1
+                self.callback(key, text, lag)
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    def get_stats(self):
+        with self.lock:
+            return {
+                "pending": len(self.pending),
+                "completed": self.completed,
+                "failed": self.failed,
+                "last_lag_ms": round(self.lags[-1] * 1000) if self.lags else None,
+                "mean_lag_ms": round(sum(self.lags) / len(self.lags) * 1000) if self.lags else None,
+            }
+
+# Endpointed recorder for single answers
+class EndpointedRecording:
+    """Record one spoken answer without blocking the caller.
+
+    Recording starts when speech is detected and stops after trailing_silence
+    seconds of quiet. Blocks are streamed to the recognizer while recording,
+    so the transcript is ready as soon as the speaker stops; result() waits
+    for it.
+    """
+    def __init__(self, samplerate=16000, threshold=SPEECH_THRESHOLD, trailing_silence=TRAILING_SILENCE,
+                 start_timeout=START_TIMEOUT, max_duration=MAX_ANSWER_SECONDS, filename=None, model=None):
+        self.samplerate = samplerate
+        self.threshold = threshold
+        self.trailing_silence = trailing_silence
+        self.start_timeout = start_timeout
+        self.max_duration = max_duration
+        self.filename = filename
+        self.blocksize = int(samplerate * BLOCK_DURATION)
+        self.pool = get_recognizer_pool(get_model(model), samplerate)
+        # Checked out by the worker, so a microphone that fails to open pins nothing
+        self.recognizer = None
+        self.q = queue.Queue(maxsize=MAX_QUEUE_BLOCKS)
+        self.future = Future()
+        self.blocks = []
+        self.state = "waiting"
+        self.stream = None
+        self.thread = None
+    
+    def start(self):
+        """Open the microphone and return immediately"""
+        try:
+            self.stream = sd.InputStream(
+                samplerate=self.samplerate,
+                channels=1,
+                blocksize=self.blocksize,
+                callback=self._callback,
+                dtype='int16'
+            )
+            self.stream.start()
+        except Exception:
+            self._close_stream()
+            raise
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+    
+    def _callback(self, indata, frames, time_info, status):
+        try:
+            self.q.put_nowait(indata.copy())
+        except queue.Full:
+            pass
+    
+    def _run(self):
+        texts = []
+        preroll = deque(maxlen=PREROLL_BLOCKS)
+        recorded = silence = 0.0
+        # Wall-clock deadline, a device that delivers no audio must still time out
+        deadline = time.monotonic() + self.start_timeout
+        try:
+            self.recognizer = self.pool.checkout()
+            while self.state != "done":
+                try:
+                    block = self.q.get(timeout=0.5)
+                except queue.Empty:
+                    if self.state == "waiting" and time.monotonic() >= deadline:
+                        break
+                    if self.state == "recording":
+                        # A stalled device counts as silence
+                        silence += 0.5
+                        if silence >= self.trailing_silence:
+                            break
+                    continue
+                duration = len(block) / self.samplerate
+                level = np.sqrt(np.mean((block.astype(np.float32) / 32768) ** 2))
+                
+                if self.state == "waiting":
+                    preroll.append(block)
+                    if level >= self.threshold:
+                        self.state = "recording"
+                        for early in preroll:
+                            self._feed(early, texts)
+                    elif time.monotonic() >= deadline:
+                        break
+                    continue
+                
+                self._feed(block, texts)
+                recorded += duration
+                silence = silence + duration if level < self.threshold else 0.0
+                if silence >= self.trailing_silence or recorded >= self.max_duration:
+                    break
+            
+            self._close_stream()
+            texts.append(json.loads(self.recognizer.FinalResult()).get("text", ""))
+            if self.filename and self.blocks:
+                sf.write(self.filename, self.get_audio(), self.samplerate)
+            self.future.set_result(" ".join(t for t in texts if t))
+        except Exception as e:
+            self._close_stream()
+            self.future.set_exception(e)
+        finally:
+            if self.recognizer is not None:
+                self.pool.checkin(self.recognizer)
+                self.recognizer = None
+            self.state = "done"
+    
+    def _feed(self, block, texts):
+        self.blocks.append(block)
+        if self.recognizer.AcceptWaveform(block.tobytes()):
+            texts.append(json.loads(self.recognizer.Result()).get("text", ""))
+    
+    def _close_stream(self):
+        if self.stream:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+    
+    def stop(self):
+        """Finish early, e.g. when the user clicks stop"""
+        self.state = "done"
+    
+    def done(self):
+        return self.future.done()
+    
+    def result(self, timeout=None):
+        """Wait for and return the transcript ("" if nobody spoke)"""
+        return self.future.result(timeout)
+    
+    def get_audio(self):
+        """Recorded int16 samples"""
+        return np.concatenate(self.blocks) if self.blocks else None
 
-def transcribe_audio(recorder):
-    """Transcribe audio from recorder"""
-    audio_data = recorder.get_audio()
-    if audio_data is not None:
-        # Convert to 16-bit PCM for Vosk
-        audio_data = (audio_data * 32767).astype(np.int16)
-        if recorder.recognizer.AcceptWaveform(audio_data.tobytes()):
-            result = json.loads(recorder.recognizer.Result())
-            return result.get("text", "")
-    return None
+def record_answer(**kwargs):
+    """Start an endpointed recording and return its handle right away"""
+    return EndpointedRecording(**kwargs).start()
 
 def record_audio(filename=None, duration=5):
     """Record audio for a fixed duration"""